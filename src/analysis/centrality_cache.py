@@ -88,6 +88,7 @@ class CentralityCache:
                 return cached
         
         print(f"[CentralityCache] Computing betweenness centrality (this may take a while)...")
+        # Exact over all sources: batching sources runs the same per-source Brandes passes, so it would not lower peak memory
         result = nx.betweenness_centrality(G)
         result_serializable = {str(k): v for k, v in result.items()}
         self._save(cache_path, result_serializable)
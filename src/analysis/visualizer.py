@@ -6,16 +6,257 @@ from ipywidgets import FloatSlider, Dropdown, VBox, HBox, Checkbox, Layout, Butt
 from ipywidgets import HTML as WidgetHTML
 from IPython.display import display, clear_output, HTML
 import os
+import weakref
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
 from src.analysis.centrality_cache import get_cache
 from src.analysis.top_n_widget import TopNDisplayController, build_comparison_static_matrix
 from src.processing.visualize import plot_static_map
 
+def _node_coordinates(G):
+    """
+    Pulls node coordinates into NumPy once.
+    Returns (node_ids, coords) for the nodes carrying 'lat'/'lon',
+    where coords is an (N, 2) float array of (lat, lon) rows.
+    """
+    node_ids = [n for n, d in G.nodes(data=True) if 'lat' in d and 'lon' in d]
+    coords = np.fromiter(
+        ((d['lat'], d['lon']) for _, d in G.nodes(data=True) if 'lat' in d and 'lon' in d),
+        dtype=np.dtype((float, 2)),
+        count=len(node_ids),
+    )
+    return node_ids, coords
+
+# Decimal places kept in emitted coordinates (~10 cm), enough for any map zoom
+_COORD_DECIMALS = 6
+
+def _geojson_positions(node_ids, coords):
+    """
+    Maps node -> (lon, lat), the coordinate order GeoJSON expects.
+    Rounded to _COORD_DECIMALS so the JSON sent to the map carries short numbers.
+    """
+    return dict(zip(node_ids, map(tuple, coords[:, ::-1].round(_COORD_DECIMALS).tolist())))
+
+def _rank_desc(scores):
+    """
+    Keys of `scores` ordered by descending value, using a C-level argsort.
+    Stable for ties, so it matches sorted(scores, key=scores.get, reverse=True).
+    """
+    keys = np.fromiter(scores, dtype=object, count=len(scores))
+    values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+    return keys[np.argsort(-values, kind='stable')].tolist()
+
+def _lcc_mask(adjacency, alive):
+    """
+    Largest connected component among the `alive` nodes of a CSR adjacency matrix, as a bitmap.
+    Ties go to the component holding the lowest node index, like max(nx.connected_components(...)).
+    """
+    lcc = np.zeros(len(alive), dtype=bool)
+    if not alive.any():
+        return lcc
+    # csgraph numbers components in order of their lowest node, so argmax keeps the first of equal sizes
+    _, labels = connected_components(adjacency[alive][:, alive], directed=False)
+    lcc[np.flatnonzero(alive)[labels == np.bincount(labels).argmax()]] = True
+    return lcc
+
+def _csr_adjacency(G, node_idx):
+    """Symmetric CSR adjacency matrix of G, rows in node_idx order."""
+    degrees = np.fromiter((len(nbrs) for nbrs in G._adj.values()), dtype=np.int32, count=len(node_idx))
+    indptr = np.zeros(len(node_idx) + 1, dtype=np.int32)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.fromiter(
+        (node_idx[nbr] for nbrs in G._adj.values() for nbr in nbrs),
+        dtype=np.int32,
+        count=int(indptr[-1]),
+    )
+    return csr_matrix(
+        (np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(len(node_idx), len(node_idx))
+    )
+
+# Point layers above this size are thinned to one point per screen-pixel cell...
+_DECIMATE_MIN_POINTS = 5000
+# ...unless the map is zoomed in further than this, where individual nodes matter
+_DECIMATE_MAX_ZOOM = 12
+
+def _decimate_points(points, zoom):
+    """
+    Keeps one point per lat/lon grid cell of 2**-zoom degrees, which is smaller than a
+    screen pixel at that zoom, so dense layers look the same but ship far fewer coordinates.
+    `points` is an (N, 2) array; small layers and close-in zooms are returned unchanged.
+    """
+    if len(points) <= _DECIMATE_MIN_POINTS or zoom > _DECIMATE_MAX_ZOOM:
+        return points
+    _, first = np.unique(np.round(points * 2.0 ** zoom), axis=0, return_index=True)
+    return points[np.sort(first)]
+
+def _edge_segments(edges, pos, lcc_set):
+    """Yields (is_core, [pos_u, pos_v]) for every edge whose endpoints both have coordinates."""
+    for u, v in edges:
+        if u in pos and v in pos:
+            yield (u in lcc_set and v in lcc_set), [pos[u], pos[v]]
+
+def _node_points(nodes, pos, lcc_set):
+    """Yields (is_core, pos_n) for every node with coordinates."""
+    for n in nodes:
+        if n in pos:
+            yield n in lcc_set, pos[n]
+
+def _split_core(items):
+    """Consumes (is_core, coords) pairs in a single pass into (core, isolated) coordinate lists."""
+    core, iso = [], []
+    for is_core, coords in items:
+        (core if is_core else iso).append(coords)
+    return core, iso
+
+def _feature_collection(geometry_type, coordinates):
+    """Wraps a list of coordinates into a FeatureCollection holding a single Multi* feature."""
+    if not coordinates:
+        return {'type': 'FeatureCollection', 'features': []}
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': geometry_type, 'coordinates': coordinates}, 'properties': {}}
+    ]}
+
+def _selection_changed(shown, key, mask, zoom=None):
+    """
+    Whether layer `key` needs new data for the boolean selection `mask` at `zoom`, recording it in `shown`.
+    Compares the mask that produced the layer's coordinates instead of the coordinates themselves.
+    Zoom levels past _DECIMATE_MAX_ZOOM draw the same points, so they count as one.
+    """
+    if zoom is not None:
+        zoom = min(zoom, _DECIMATE_MAX_ZOOM + 1)
+    last = shown.get(key)
+    if last is not None and last[1] == zoom and np.array_equal(last[0], mask):
+        return False
+    shown[key] = (mask, zoom)
+    return True
+
 class NetworkVisualizer:
     def __init__(self):
         self.is_ci = os.environ.get('CI', 'false').lower() == 'true' or os.environ.get('GITHUB_ACTIONS', 'false').lower() == 'true'
         if self.is_ci:
             print("NetworkVisualizer: CI environment detected. Interactive plots will be skipped to prevent build failures.")
+        # Heavy per-graph precomputations (coordinates, centrality orderings, LCC).
+        # Weakly keyed, so graphs are not kept alive by the visualizer.
+        self._graph_cache = weakref.WeakKeyDictionary()
+
+    def _graph_entry(self, G):
+        """
+        Returns the cache entry for G. A change in node or edge count starts a fresh entry;
+        other edits (moved nodes, rewired edges) need clear_cache(G) first.
+        """
+        shape = (G.number_of_nodes(), G.number_of_edges())
+        entry = self._graph_cache.get(G)
+        if entry is None or entry['shape'] != shape:
+            entry = {'shape': shape}
+            self._graph_cache[G] = entry
+        return entry
+
+    def clear_cache(self, G=None):
+        """Drops the cached precomputations for G, or for every graph if G is None."""
+        if G is None:
+            self._graph_cache.clear()
+        else:
+            self._graph_cache.pop(G, None)
+
+    def _largest_cc(self, G):
+        """Node set of the largest connected component of G (cached per graph)."""
+        entry = self._graph_entry(G)
+        if 'lcc_set' not in entry:
+            entry['lcc_set'] = set(max(nx.connected_components(G), key=len)) if len(G) > 0 else set()
+        return entry['lcc_set']
+
+    def _setup_graph_data(self, G):
+        """
+        Precomputes everything the interactive comparison needs for one graph:
+        GeoJSON positions, map center and the node orderings of each attack strategy.
+        Cached per graph so repeated renders don't pay the setup cost again.
+        Returns None if the graph has no coordinates.
+        """
+        entry = self._graph_entry(G)
+        if 'setup' in entry:
+            return entry['setup']
+
+        node_ids, coords = _node_coordinates(G)
+        
+        if not node_ids:
+            entry['setup'] = None
+            return None
+
+        geojson_pos = _geojson_positions(node_ids, coords)
+        center = tuple(coords.mean(axis=0).tolist())
+        
+        # Pre-calc strategies (using cache for expensive operations)
+        cache = get_cache()
+        d_cent = cache.get_degree_centrality(G)
+        b_cent = cache.get_betweenness_centrality(G)
+        
+        sorted_deg = _rank_desc(d_cent)
+
+        # Pre-calc Articulation Points (using cache)
+        try:
+            articulation_points = set(cache.get_articulation_points(G))
+            # Articulation points first, then the other nodes, each group by degree centrality (descending).
+            # One stable lexsort: last key is primary, ties keep d_cent order.
+            deg_nodes = np.fromiter(d_cent, dtype=object, count=len(d_cent))
+            deg_values = np.fromiter(d_cent.values(), dtype=np.float64, count=len(d_cent))
+            ap_mask = np.fromiter((n in articulation_points for n in d_cent), dtype=bool, count=len(d_cent))
+            sorted_articulation = deg_nodes[np.lexsort((-deg_values, ~ap_mask))].tolist()
+        except Exception: # Catch potential errors if graph is too simple or specific
+            # Fallback to degree centrality if articulation points calculation fails
+            sorted_articulation = sorted_deg
+
+        sorted_bet = _rank_desc(b_cent)
+        
+        # Edge endpoints as index arrays (SoA) so per-tick filtering is pure NumPy.
+        # Only edges with both endpoints positioned are kept, since only those are drawn.
+        all_nodes = list(G.nodes())
+        node_idx = {n: i for i, n in enumerate(all_nodes)}
+        drawable_edges = [(u, v) for u, v in G.edges() if u in geojson_pos and v in geojson_pos]
+        u_arr = np.fromiter((node_idx[u] for u, _ in drawable_edges), np.int32, count=len(drawable_edges))
+        v_arr = np.fromiter((node_idx[v] for _, v in drawable_edges), np.int32, count=len(drawable_edges))
+        # Node positions aligned with node_idx; has_pos marks the rows that hold real coordinates
+        pos_arr = np.zeros((len(all_nodes), 2), dtype=np.float64)
+        has_pos = np.zeros(len(all_nodes), dtype=bool)
+        pos_rows = np.fromiter((node_idx[n] for n in geojson_pos), np.intp, count=len(geojson_pos))
+        pos_arr[pos_rows] = list(geojson_pos.values())
+        has_pos[pos_rows] = True
+        # Full adjacency as CSR for the per-tick connected components
+        adjacency = _csr_adjacency(G, node_idx)
+        edge_coords = np.asarray(
+            [[geojson_pos[u], geojson_pos[v]] for u, v in drawable_edges], dtype=np.float64
+        ).reshape(-1, 2, 2)
+
+        # Removal order of each strategy as node indices (-1 for ids not in G), so a tick only slices.
+        # Random: one fixed permutation keeps subset stability
+        # (if frac 0.1 -> 0.2, the 0.1 nodes are still removed) without reshuffling every tick.
+        def as_indices(order):
+            return np.fromiter((node_idx.get(n, -1) for n in order), np.intp, count=len(order))
+
+        removal_idx = {
+            'rand': np.random.default_rng(42).permutation(len(all_nodes)),
+            'deg': as_indices(sorted_deg),
+            'bet': as_indices(sorted_bet),
+            'art': as_indices(sorted_articulation),
+        }
+
+        entry['setup'] = {
+            'pos': geojson_pos,
+            'center': center,
+            'sorted_deg': sorted_deg,
+            'sorted_bet': sorted_bet,
+            'sorted_art': sorted_articulation,
+            'removal_idx': removal_idx,
+            'nodes': all_nodes,
+            'node_idx': node_idx,
+            'u_arr': u_arr,
+            'v_arr': v_arr,
+            'edge_coords': edge_coords,
+            'pos_arr': pos_arr,
+            'has_pos': has_pos,
+            'adjacency': adjacency,
+        }
+        return entry['setup']
 
     def create_interactive_map_ui(self, G):
         """
@@ -45,21 +286,15 @@ class NetworkVisualizer:
             return None
 
         # Pre-process coordinates for speed
-        geojson_pos = {}
-        lats, lons = [], []
-        for n, d in G.nodes(data=True):
-            if 'lat' in d and 'lon' in d:
-                # GeoJSON uses (Lon, Lat)
-                geojson_pos[n] = (d['lon'], d['lat'])
-                lats.append(d['lat'])
-                lons.append(d['lon'])
+        node_ids, coords = _node_coordinates(G)
         
-        if not lats:
+        if not node_ids:
             print("No coordinates found in graph.")
             return None
 
-        center_lat = sum(lats) / len(lats)
-        center_lon = sum(lons) / len(lons)
+        # GeoJSON uses (Lon, Lat)
+        geojson_pos = _geojson_positions(node_ids, coords)
+        center_lat, center_lon = coords.mean(axis=0).tolist()
 
         # Pre-calculate centralities (using cache for expensive operations)
         print("Loading centralities for interactive map...")
@@ -592,19 +827,13 @@ class NetworkVisualizer:
             return None
 
         # Pre-process coordinates
-        geojson_pos = {}
-        lats, lons = [], []
-        for n, d in G.nodes(data=True):
-            if 'lat' in d and 'lon' in d:
-                geojson_pos[n] = (d['lon'], d['lat'])
-                lats.append(d['lat'])
-                lons.append(d['lon'])
+        node_ids, coords = _node_coordinates(G)
         
-        if not lats:
+        if not node_ids:
             return None
 
-        center_lat = sum(lats) / len(lats)
-        center_lon = sum(lons) / len(lons)
+        geojson_pos = _geojson_positions(node_ids, coords)
+        center_lat, center_lon = coords.mean(axis=0).tolist()
 
         # 1. Initialize Map
         m = Map(center=(center_lat, center_lon), zoom=8, basemap=basemaps.CartoDB.Positron, scroll_wheel_zoom=True)
@@ -616,46 +845,23 @@ class NetworkVisualizer:
         style_node_core = {'radius': 6, 'color': 'blue', 'fillColor': 'blue', 'fillOpacity': 0.8}
         style_node_iso = {'radius': 6, 'color': 'red', 'fillColor': 'red', 'fillOpacity': 0.8}
 
-        # 3. Calculate Components (Initial State)
-        if len(G) > 0:
-            largest_cc = max(nx.connected_components(G), key=len)
-            lcc_set = set(largest_cc)
-        else:
-            lcc_set = set()
+        # 3. Calculate Components (Initial State, cached per graph)
+        lcc_set = self._largest_cc(G)
 
         # 4. Construct Features
-        core_edges = []
-        iso_edges = []
-        core_nodes = []
-        iso_nodes = []
-
-        # Edges
-        for u, v in G.edges():
-            if u in geojson_pos and v in geojson_pos:
-                coords = [geojson_pos[u], geojson_pos[v]]
-                feat = {'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': [coords]}, 'properties': {}}
-                if u in lcc_set and v in lcc_set:
-                    core_edges.append(feat)
-                else:
-                    iso_edges.append(feat)
-        
-        # Nodes
+        # Edges and nodes are streamed straight into the coordinate lists of one
+        # MultiLineString / MultiPoint feature per layer (the layer style applies uniformly).
+        core_edges, iso_edges = _split_core(_edge_segments(G.edges(), geojson_pos, lcc_set))
         # For the construction story, visualization of nodes is important context
-        for n in G.nodes():
-            if n in geojson_pos:
-                feat = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': geojson_pos[n]}, 'properties': {}}
-                if n in lcc_set:
-                    core_nodes.append(feat)
-                else:
-                    iso_nodes.append(feat)
+        core_nodes, iso_nodes = _split_core(_node_points(G.nodes(), geojson_pos, lcc_set))
 
         # 5. Layers
-        layer_edges_core = GeoJSON(data={'type': 'FeatureCollection', 'features': core_edges}, style=style_core, name='Edges (Core)')
-        layer_edges_iso = GeoJSON(data={'type': 'FeatureCollection', 'features': iso_edges}, style=style_iso, name='Edges (Isolated)')
+        layer_edges_core = GeoJSON(data=_feature_collection('MultiLineString', core_edges), style=style_core, name='Edges (Core)')
+        layer_edges_iso = GeoJSON(data=_feature_collection('MultiLineString', iso_edges), style=style_iso, name='Edges (Isolated)')
         
         # Note: Point styling in GeoJSON layer is done via point_style
-        layer_nodes_core = GeoJSON(data={'type': 'FeatureCollection', 'features': core_nodes}, point_style=style_node_core, name='Nodes (Core)')
-        layer_nodes_iso = GeoJSON(data={'type': 'FeatureCollection', 'features': iso_nodes}, point_style=style_node_iso, name='Nodes (Isolated)')
+        layer_nodes_core = GeoJSON(data=_feature_collection('MultiPoint', core_nodes), point_style=style_node_core, name='Nodes (Core)')
+        layer_nodes_iso = GeoJSON(data=_feature_collection('MultiPoint', iso_nodes), point_style=style_node_iso, name='Nodes (Isolated)')
 
         m.add_layer(layer_edges_core)
         m.add_layer(layer_edges_iso)
@@ -678,13 +884,21 @@ class NetworkVisualizer:
         """
         Plots the degree distribution of the network (Histogram and Log-Log).
         """
-        degrees = [d for n, d in G.degree()]
+        degrees = np.fromiter((d for _, d in G.degree()), dtype=np.int64, count=G.number_of_nodes())
+        
+        # Bin once and draw both panels from the same counts. Degrees are ints, so histogramming
+        # the bincount (one entry per distinct degree) gives exactly np.histogram(degrees, bins).
+        degree_counts = np.bincount(degrees)
+        hist, edges = np.histogram(
+            np.arange(len(degree_counts)), bins=bins, weights=degree_counts,
+            range=(degrees.min(), degrees.max()) if len(degrees) else None,
+        )
         
         plt.figure(figsize=(12, 5))
         
         # 1. Linear Scale Histogram
         plt.subplot(1, 2, 1)
-        plt.hist(degrees, bins=bins, color='skyblue', edgecolor='black')
+        plt.bar(edges[:-1], hist, width=np.diff(edges), align='edge', color='skyblue', edgecolor='black')
         plt.title(f"{title} (Linear)")
         plt.xlabel("Degree")
         plt.ylabel("Count")
@@ -693,7 +907,7 @@ class NetworkVisualizer:
         plt.subplot(1, 2, 2)
         
         # Use linear bins, same as left plot, but with log yScale
-        plt.hist(degrees, bins=bins, color='salmon', edgecolor='black', log=True)
+        plt.bar(edges[:-1], hist, width=np.diff(edges), align='edge', color='salmon', edgecolor='black')
         plt.yscale('log')
         
         plt.title(f"{title} (Semi-Log)")
@@ -746,64 +960,28 @@ class NetworkVisualizer:
             
             return None
 
-        # --- Helper to Setup Data for a Graph ---
-        def setup_graph_data(G):
-            geojson_pos = {}
-            lats, lons = [], []
-            for n, d in G.nodes(data=True):
-                if 'lat' in d and 'lon' in d:
-                    geojson_pos[n] = (d['lon'], d['lat'])
-                    lats.append(d['lat'])
-                    lons.append(d['lon'])
-            
-            if not lats: return None, None, None, None, None, None
-
-            center = (sum(lats)/len(lats), sum(lons)/len(lons))
-            
-            # Pre-calc strategies (using cache for expensive operations)
-            cache = get_cache()
-            d_cent = cache.get_degree_centrality(G)
-            b_cent = cache.get_betweenness_centrality(G)
-            
-            # Pre-calc Articulation Points (using cache)
-            try:
-                articulation_points = cache.get_articulation_points(G)
-                # Sort articulation points by degree centrality (descending)
-                ap_list = sorted([n for n in articulation_points], key=d_cent.get, reverse=True)
-                # Add other nodes, also sorted by degree, after articulation points
-                others = sorted([n for n in d_cent if n not in articulation_points], key=d_cent.get, reverse=True)
-                sorted_articulation = ap_list + others
-            except Exception: # Catch potential errors if graph is too simple or specific
-                # Fallback to degree centrality if articulation points calculation fails
-                sorted_articulation = sorted(d_cent, key=d_cent.get, reverse=True)
-
-
-            sorted_deg = sorted(d_cent, key=d_cent.get, reverse=True)
-            sorted_bet = sorted(b_cent, key=b_cent.get, reverse=True)
-            
-            all_nodes = list(G.nodes())
-            
-            return geojson_pos, center, sorted_deg, sorted_bet, sorted_articulation, all_nodes
-
-        # Setup Data
-        pos1, center1, deg1, bet1, art1, nodes1 = setup_graph_data(G1)
-        pos2, center2, deg2, bet2, art2, nodes2 = setup_graph_data(G2)
+        # Setup Data (cached per graph). Sequential on purpose: the setup is GIL-bound NetworkX work, threads give no speedup
+        data1 = self._setup_graph_data(G1)
+        data2 = self._setup_graph_data(G2)
         
-        if not pos1 or not pos2:
+        if not data1 or not data2:
             print("Error: Missing coordinates.")
             return None
 
+        center1, deg1, bet1, art1 = (data1[k] for k in ('center', 'sorted_deg', 'sorted_bet', 'sorted_art'))
+        center2, deg2, bet2, art2 = (data2[k] for k in ('center', 'sorted_deg', 'sorted_bet', 'sorted_art'))
+
         # --- Helper to Create Layers ---
         def create_layers(m, color_core, color_iso):
-            l_edges_core = GeoJSON(data={'type': 'FeatureCollection', 'features': []}, 
+            l_edges_core = GeoJSON(data=_feature_collection('MultiLineString', []), 
                                   style={'color': color_core, 'weight': 1, 'opacity': 0.6}, name='Edges (Core)')
-            l_edges_iso = GeoJSON(data={'type': 'FeatureCollection', 'features': []}, 
+            l_edges_iso = GeoJSON(data=_feature_collection('MultiLineString', []), 
                                  style={'color': color_iso, 'weight': 1, 'opacity': 0.6}, name='Edges (Iso)')
-            l_nodes_core = GeoJSON(data={'type': 'FeatureCollection', 'features': []}, 
+            l_nodes_core = GeoJSON(data=_feature_collection('MultiPoint', []), 
                                   point_style={'radius': 3, 'color': color_core, 'fillColor': color_core, 'fillOpacity': 0.8}, name='Nodes (Core)')
-            l_nodes_iso = GeoJSON(data={'type': 'FeatureCollection', 'features': []},
+            l_nodes_iso = GeoJSON(data=_feature_collection('MultiPoint', []),
                                  point_style={'radius': 4, 'color': color_iso, 'fillColor': color_iso, 'fillOpacity': 0.8}, name='Nodes (Iso)')
-            l_nodes_removed = GeoJSON(data={'type': 'FeatureCollection', 'features': []},
+            l_nodes_removed = GeoJSON(data=_feature_collection('MultiPoint', []),
                                      point_style={'radius': 2, 'color': '#999999', 'fillColor': '#999999', 'fillOpacity': 0.3}, name='Nodes (Removed)')
             
             # Order: Edges first, then Removed nodes (background), then Active nodes (foreground)
@@ -836,115 +1014,98 @@ class NetworkVisualizer:
         layers2 = create_layers(m2, 'blue', 'red')
 
         # --- Update Logic ---
-        def get_geo_updates(G, pos, strategy_type, fraction, sorted_degree, sorted_betweenness, sorted_articulation, all_nodes_list):
-            num_remove = int(len(G) * fraction)
-            remove_nodes = []
-            
-            if strategy_type == "Random":
-                # Deterministic random for stability in UI
-                rng = np.random.RandomState(42) 
-                # Use permutation to ensure subset stability (if frac 0.1 -> 0.2, the 0.1 nodes are still removed)
-                permuted_nodes = rng.permutation(all_nodes_list)
-                remove_nodes = permuted_nodes[:num_remove]
-            elif strategy_type == "Targeted (Degree)":
-                remove_nodes = sorted_degree[:num_remove]
-            elif strategy_type == "Targeted (Betweenness)":
-                remove_nodes = sorted_betweenness[:num_remove]
-            elif strategy_type == "Inverse Targeted (Degree)":
-                 remove_nodes = sorted_degree[-num_remove:] if num_remove > 0 else []
-            elif strategy_type == "Inverse Targeted (Betweenness)":
-                 remove_nodes = sorted_betweenness[-num_remove:] if num_remove > 0 else []
-            elif strategy_type == "Targeted (Articulation)":
-                remove_nodes = sorted_articulation[:num_remove]
-            
-            remove_set = set(remove_nodes)
-            G_temp = G.copy()
-            G_temp.remove_nodes_from(remove_nodes)
-            
-            if len(G_temp) > 0:
-                largest_cc = max(nx.connected_components(G_temp), key=len)
-                lcc_set = set(largest_cc)
+        # Strategy -> (removal order in the setup data, removed from the far end)
+        strategy_orders = {
+            "Random": ('rand', False),
+            "Targeted (Degree)": ('deg', False),
+            "Targeted (Betweenness)": ('bet', False),
+            "Inverse Targeted (Degree)": ('deg', True),
+            "Inverse Targeted (Betweenness)": ('bet', True),
+            "Targeted (Articulation)": ('art', False),
+        }
+
+        # Last slider state of each map pane, so panes (even on the same graph) never share an alive mask
+        tick1, tick2 = {}, {}
+
+        def alive_mask(data, tick, strategy_type, num_remove):
+            """
+            Mask of the nodes left after removing the first num_remove nodes of the strategy's order.
+            Slider steps within one strategy only flip the nodes between the previous and the new count
+            of the pane whose state is kept in tick.
+            """
+            key, from_end = strategy_orders.get(strategy_type, (None, False))
+            order = data['removal_idx'][key] if key else np.empty(0, dtype=np.intp)
+            if from_end:
+                order = order[::-1]
+
+            if tick.get('strategy') != strategy_type:
+                alive, done = np.ones(len(data['nodes']), dtype=bool), 0
             else:
-                lcc_set = set()
-                
-            # Build Features
-            core_lines, iso_lines = [], []
-            core_pts, iso_pts, removed_pts = [], [], []
-            
-            for u, v in G.edges():
-                if u in G_temp and v in G_temp:
-                    if u in pos and v in pos:
-                        coords = [pos[u], pos[v]]
-                        if u in lcc_set and v in lcc_set:
-                            core_lines.append(coords)
-                        else:
-                            iso_lines.append(coords)
-                            
-            # Optimization: Skip nodes if too many (>5k) to keep slider smooth?
-            # User wants visual, so let's try to keep them.
-            # if len(G_temp) < 10000: # Removed limit per user request
-            
-            # Add Active Nodes
-            for n in G_temp.nodes():
-                if n in pos:
-                    pt = pos[n]
-                    if n in lcc_set:
-                        core_pts.append(pt)
-                    else:
-                        iso_pts.append(pt)
-            
-            # Add Removed Nodes (Ghosts)
-            for n in remove_set:
-                if n in pos:
-                    removed_pts.append(pos[n])
-                            
-            return core_lines, iso_lines, core_pts, iso_pts, removed_pts
+                alive, done = tick['alive'], tick['removed']
+            # ids unknown to G are skipped, as remove_nodes_from does
+            if num_remove >= done:
+                step = order[done:num_remove]
+                alive[step[step >= 0]] = False
+            else:
+                step = order[num_remove:done]
+                alive[step[step >= 0]] = True
+            tick.update(strategy=strategy_type, removed=num_remove, alive=alive)
+            return alive
+
+        def get_layer_masks(G, data, tick, strategy_type, fraction):
+            alive = alive_mask(data, tick, strategy_type, int(len(G) * fraction))
+            # LCC of the induced subgraph, straight from the CSR arrays
+            in_lcc = _lcc_mask(data['adjacency'], alive)
+
+            # Edges and nodes each layer shows, as boolean masks over the setup arrays
+            u_arr, v_arr = data['u_arr'], data['v_arr']
+            edge_alive = alive[u_arr] & alive[v_arr]
+            edge_core = in_lcc[u_arr] & in_lcc[v_arr]
+            has_pos = data['has_pos']
+            # Active nodes split by LCC membership, removed nodes as ghosts
+            return edge_core, edge_alive & ~edge_core, has_pos & in_lcc, has_pos & alive & ~in_lcc, has_pos & ~alive
+
+        def apply_geo_updates(layers, data, tick, masks, zoom, show_removed, show_nodes):
+            core_edges, iso_edges, core_nodes, iso_nodes, removed_nodes = masks
+            # Selections last sent to this pane's layers; layers whose selection did not change are not re-sent
+            shown = tick.setdefault('shown', {})
+
+            def set_lines(i, mask):
+                if _selection_changed(shown, i, mask):
+                    layers[i].data = _feature_collection('MultiLineString', data['edge_coords'][mask].tolist())
+
+            def set_points(i, mask):
+                # Thinned at overview zooms
+                if _selection_changed(shown, i, mask, zoom):
+                    layers[i].data = _feature_collection('MultiPoint', _decimate_points(data['pos_arr'][mask], zoom).tolist())
 
-        def update_both(change=None):
-            strat = strat_dd.value
-            frac = frac_sl.value
-            show_removed = show_removed_chk.value
-            show_nodes = show_nodes_chk.value
-            
-            # Map 1 Update
-            c1, i1, cp1, ip1, rem1 = get_geo_updates(G1, pos1, strat, frac, deg1, bet1, art1, nodes1)
-            
             # Critical: Update layers in Z-order (Bottom -> Top). Last updated = Top.
             # 1. Removed (Gray) - Bottom
             # User Request: If "Show Nodes" is unchecked, hide ALL nodes (including gray ones).
-            rem1_data = rem1 if (show_removed and show_nodes) else []
-            layers1[4].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': rem1_data}, 'properties': {}}]} if rem1_data else {'type': 'FeatureCollection', 'features': []}
-            
+            set_points(4, removed_nodes & (show_removed and show_nodes))
             # 2. Edges
-            layers1[0].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': c1}, 'properties': {}}]} if c1 else {'type': 'FeatureCollection', 'features': []}
-            layers1[1].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': i1}, 'properties': {}}]} if i1 else {'type': 'FeatureCollection', 'features': []}
-            
+            set_lines(0, core_edges)
+            set_lines(1, iso_edges)
             # 3. Iso (Red) - Middle
-            ip1_data = ip1 if show_nodes else []
-            layers1[3].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': ip1_data}, 'properties': {}}]} if ip1_data else {'type': 'FeatureCollection', 'features': []}
-            
+            set_points(3, iso_nodes & show_nodes)
             # 4. Core (Blue) - Top (Last Updated)
-            cp1_data = cp1 if show_nodes else []
-            layers1[2].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': cp1_data}, 'properties': {}}]} if cp1_data else {'type': 'FeatureCollection', 'features': []}
-            
-            # Map 2 Update
-            c2, i2, cp2, ip2, rem2 = get_geo_updates(G2, pos2, strat, frac, deg2, bet2, art2, nodes2)
-            
-            # 1. Removed (Gray)
-            rem2_data = rem2 if (show_removed and show_nodes) else []
-            layers2[4].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': rem2_data}, 'properties': {}}]} if rem2_data else {'type': 'FeatureCollection', 'features': []}
+            set_points(2, core_nodes & show_nodes)
 
-            # 2. Edges
-            layers2[0].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': c2}, 'properties': {}}]} if c2 else {'type': 'FeatureCollection', 'features': []}
-            layers2[1].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': i2}, 'properties': {}}]} if i2 else {'type': 'FeatureCollection', 'features': []}
-            
-            # 3. Iso (Red)
-            ip2_data = ip2 if show_nodes else []
-            layers2[3].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': ip2_data}, 'properties': {}}]} if ip2_data else {'type': 'FeatureCollection', 'features': []}
-            
-            # 4. Core (Blue)
-            cp2_data = cp2 if show_nodes else []
-            layers2[2].data = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': cp2_data}, 'properties': {}}]} if cp2_data else {'type': 'FeatureCollection', 'features': []}
+        def update_map(m, layers, G, data, tick):
+            masks = get_layer_masks(G, data, tick, strat_dd.value, frac_sl.value)
+            apply_geo_updates(layers, data, tick, masks, m.zoom, show_removed_chk.value, show_nodes_chk.value)
+
+        def update_both(change=None):
+            # One block per map; layers whose selection did not change are not re-sent
+            update_map(m1, layers1, G1, data1, tick1)
+            update_map(m2, layers2, G2, data2, tick2)
+
+        def on_zoom(m, layers, G, data, tick):
+            def handler(change):
+                # Decimation depends on zoom only up to _DECIMATE_MAX_ZOOM
+                if min(change['old'], change['new']) <= _DECIMATE_MAX_ZOOM:
+                    update_map(m, layers, G, data, tick)
+            return handler
 
         # Controls
         # Full list of strategies
@@ -1077,6 +1238,8 @@ class NetworkVisualizer:
         frac_sl.observe(update_top_n, names='value')
         strat_dd.observe(update_both, names='value')
         frac_sl.observe(update_both, names='value')
+        m1.observe(on_zoom(m1, layers1, G1, data1, tick1), names='zoom')
+        m2.observe(on_zoom(m2, layers2, G2, data2, tick2), names='zoom')
         
         # Initial calls
         update_both()
@@ -1,13 +1,15 @@
 
+import pandas as pd
 import geopandas as gpd
 import networkx as nx
 import pickle
 import numpy as np
 from pathlib import Path
+import shapely
 from shapely.geometry import Point, LineString
-from shapely.ops import unary_union
-from collections import defaultdict, Counter
 from scipy.spatial import cKDTree
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
 
 def load_data(base_dir):
@@ -19,10 +21,16 @@ def load_data(base_dir):
     print(f"Processing Japan dataset from: {base_dir}")
     print("Loading stations...")
     try:
-        gdf_stations = gpd.read_file(station_path)
+        # pyogrio + Arrow reads the columns in bulk; only the attributes the pipeline uses are loaded
+        gdf_stations = gpd.read_file(
+            station_path, engine='pyogrio', use_arrow=True,
+            columns=['N02_005', 'N02_005g', 'N02_004', 'N02_005c'],
+        )
         print(f"Loaded {len(gdf_stations)} stations.")
         print("Loading railroad sections...")
-        gdf_railroads = gpd.read_file(railroad_path)
+        gdf_railroads = gpd.read_file(
+            railroad_path, engine='pyogrio', use_arrow=True, columns=['N02_003', 'N02_004'],
+        )
         print(f"Loaded {len(gdf_railroads)} railroad sections.")
     except Exception as e:
         print(f"Error loading GeoJSON files: {e}")
@@ -32,16 +40,28 @@ def load_data(base_dir):
 def group_stations(gdf_stations):
     """Groups station platforms by Group Code."""
     print("Step 1: Grouping station platforms...")
-    group_code_groups = defaultdict(list)
-    for idx, station in gdf_stations.iterrows():
-        group_code = station['N02_005g']
-        group_code_groups[group_code].append({
+    def column(name):
+        return gdf_stations[name].tolist() if name in gdf_stations.columns else [None] * len(gdf_stations)
+
+    platforms = [
+        {
             'idx': idx,
-            'geometry': station.geometry,
-            'name': station['N02_005'],
-            'operator': station.get('N02_004'),
-            'station_code': station.get('N02_005c'),
-        })
+            'geometry': geometry,
+            'name': name,
+            'operator': operator,
+            'station_code': station_code,
+        }
+        for idx, geometry, name, operator, station_code in zip(
+            gdf_stations.index, gdf_stations.geometry, gdf_stations['N02_005'].tolist(),
+            column('N02_004'), column('N02_005c'),
+        )
+    ]
+    # Row positions per group code, in order of first appearance
+    group_positions = gdf_stations.groupby('N02_005g', sort=False, dropna=False).indices
+    group_code_groups = {
+        group_code: [platforms[i] for i in positions]
+        for group_code, positions in group_positions.items()
+    }
     print(f"Found {len(group_code_groups)} unique group codes")
     return group_code_groups
 
@@ -49,19 +69,32 @@ def create_initial_nodes(group_code_groups):
     """Creates initial station nodes from platform groups."""
     print("Step 2: Creating station nodes...")
     station_groups = {}
+
+    # Vertices of every platform geometry in one call; each group's vertices form one contiguous block
+    all_geoms = np.array([p['geometry'] for platforms in group_code_groups.values() for p in platforms], dtype=object)
+    all_coords, vertex_geom = shapely.get_coordinates(all_geoms, return_index=True)
+    geom_bounds = np.cumsum([0] + [len(platforms) for platforms in group_code_groups.values()])
+    vertex_bounds = np.searchsorted(vertex_geom, geom_bounds)
+
+    # Most common platform name per group, counted in one groupby; ties go to the name seen first
+    platform_names = pd.DataFrame({
+        'group': np.repeat(np.arange(len(group_code_groups)), np.diff(geom_bounds)),
+        'name': [p['name'] for platforms in group_code_groups.values() for p in platforms],
+    })
+    platform_names = platform_names[platform_names['name'].map(bool)]
+    name_counts = platform_names.groupby(['group', 'name'], sort=False).size()
+    display_names = dict(name_counts.groupby(level='group', sort=False).idxmax().tolist())
     
-    for group_code, platforms in group_code_groups.items():
+    for k, (group_code, platforms) in enumerate(group_code_groups.items()):
         station_id = group_code
-        all_platform_geoms = [p['geometry'] for p in platforms]
-        combined_platforms = unary_union(all_platform_geoms)
+        combined_platforms = shapely.union_all(all_geoms[geom_bounds[k]:geom_bounds[k + 1]])
         centroid = combined_platforms.centroid
         
         names = list(set(p['name'] for p in platforms if p['name']))
         operators = list(set(p['operator'] for p in platforms if p['operator']))
-        coords = list(set([coord for p in platforms for coord in p['geometry'].coords]))
+        coords = list(set(map(tuple, all_coords[vertex_bounds[k]:vertex_bounds[k + 1]].tolist())))
         
-        name_counts = Counter(p['name'] for p in platforms if p['name'])
-        display_name = max(name_counts, key=name_counts.get) if name_counts else f"Station_{group_code}"
+        display_name = display_names.get(k, f"Station_{group_code}")
         
         station_groups[station_id] = {
             'centroid': centroid,
@@ -81,48 +114,39 @@ def merge_interchange_stations(station_groups):
     """Merges station groups that share physical coordinates."""
     # (Simplified for modular reuse, full logic preserved below)
     print("Step 3: Merging interchange stations...")
-    coord_to_groups = defaultdict(set)
     coord_to_station = {}
-    
-    for group_code, data in station_groups.items():
-        for coord in data['coords']:
-            coord_to_groups[coord].add(group_code)
 
-    shared_coords = {coord: groups for coord, groups in coord_to_groups.items() if len(groups) > 1}
+    # One row per (group, coordinate); each group's coords are already unique, so a coordinate
+    # appearing in several rows is shared between groups. Every row is linked to the first group
+    # holding its coordinate (a star per coordinate is enough for connectivity).
+    codes = list(station_groups)
+    coord_rows = pd.DataFrame(
+        [coord for data in station_groups.values() for coord in data['coords']], columns=['x', 'y']
+    )
+    coord_rows['group'] = np.repeat(
+        np.arange(len(codes)), [len(data['coords']) for data in station_groups.values()]
+    )
+    coord_rows['first_group'] = coord_rows.groupby(['x', 'y'], sort=False)['group'].transform('first')
+    shared = coord_rows[coord_rows['group'] != coord_rows['first_group']]
 
-    if shared_coords:
-        interchange_pairs = defaultdict(set)
-        for coord, groups in shared_coords.items():
-            groups_list = list(groups)
-            for i in range(len(groups_list)):
-                for j in range(i + 1, len(groups_list)):
-                    interchange_pairs[groups_list[i]].add(groups_list[j])
-                    interchange_pairs[groups_list[j]].add(groups_list[i])
-        
-        parent = {code: code for code in station_groups}
-        def find(x):
-            if parent[x] != x:
-                parent[x] = find(parent[x])
-            return parent[x]
-        
-        def union(x, y):
-            px, py = find(x), find(y)
-            if px != py:
-                parent[px] = py
-        
-        for group_code, partners in interchange_pairs.items():
-            for partner in partners:
-                union(group_code, partner)
-        
-        root_to_members = defaultdict(set)
-        for code in station_groups:
-            root_to_members[find(code)].add(code)
+    if len(shared):
+        # The interchange clusters are the connected components of that sparse graph
+        rows = shared['first_group'].to_numpy()
+        cols = shared['group'].to_numpy()
+        links = csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(codes), len(codes))
+        )
+        _, labels = connected_components(links, directed=False)
+        by_component = np.argsort(labels, kind='stable')
+        components = np.split(by_component, np.cumsum(np.bincount(labels))[:-1])
             
+        name_lens = {code: len(data['name']) for code, data in station_groups.items()}
         merged_count = 0
-        for root, member_codes in root_to_members.items():
+        for component in components:
+            member_codes = [codes[i] for i in component]
             if len(member_codes) > 1:
                 merged_count += 1
-                representative = min(member_codes, key=lambda c: len(station_groups[c]['name']))
+                representative = min(member_codes, key=name_lens.get)
                 
                 all_coords = list(set(coord for code in member_codes for coord in station_groups[code]['coords']))
                 all_names = list(set(name for code in member_codes for name in station_groups[code]['all_names']))
@@ -151,15 +175,19 @@ def build_graph(station_groups, coord_to_station, gdf_railroads, spatial_snappin
     """Builds the final graph linking stations and railroads."""
     print("Step 4: Building NetworkX graph...")
     G = nx.Graph()
-    for station_id, data in station_groups.items():
-        G.add_node(
+    G.add_nodes_from(
+        (
             station_id,
-            node_type='station',
-            lat=data['lat'],
-            lon=data['lon'],
-            name=data['name'],
-            operators=data.get('operators', []),
+            {
+                'node_type': 'station',
+                'lat': data['lat'],
+                'lon': data['lon'],
+                'name': data['name'],
+                'operators': data.get('operators', []),
+            },
         )
+        for station_id, data in station_groups.items()
+    )
 
     # KD-Tree for spatial snapping
     all_station_coords = []
@@ -172,56 +200,89 @@ def build_graph(station_groups, coord_to_station, gdf_railroads, spatial_snappin
     SNAP_THRESHOLD_DEG = 2e-6  # ~20cm
 
     infra_node_counter = 0
-    infra_nodes = {}
-    infra_coords_list = []
+    # Infra node ids in creation order, aligned with the rows of infra_coords
+    infra_id_list = []
+    # Graph rows collected while resolving sections and inserted in bulk at the end
+    infra_node_rows = []
+    # Infra coordinates in creation order. The first `committed` rows are indexed by infra_tree,
+    # the rows after them form a staging buffer searched by brute force. The tree is rebuilt only
+    # once the buffer outgrows it, so rebuilds happen at geometric intervals.
+    infra_coords = np.empty((64, 2))
+    committed = 0
     infra_tree = None
 
-    def get_or_create_infra_node(coord):
-        nonlocal infra_node_counter, infra_tree
-        if infra_coords_list:
-            if infra_tree is None or len(infra_coords_list) > len(infra_tree.data):
-                infra_tree = cKDTree(np.array(infra_coords_list))
+    def nearest_infra(coord):
+        dist, idx = np.inf, -1
+        if infra_tree is not None:
             dist, idx = infra_tree.query(coord)
-            if spatial_snapping and dist <= SNAP_THRESHOLD_DEG:
-                return list(infra_nodes.values())[idx]
+        staged = infra_coords[committed:infra_node_counter]
+        if len(staged):
+            staged_dists = np.sqrt(((staged - coord) ** 2).sum(axis=1))
+            k = int(staged_dists.argmin())
+            if staged_dists[k] < dist:
+                dist, idx = staged_dists[k], committed + k
+        return dist, idx
+
+    def get_or_create_infra_node(coord):
+        nonlocal infra_node_counter, infra_tree, committed, infra_coords
+        if spatial_snapping and infra_node_counter:
+            dist, idx = nearest_infra(coord)
+            if dist <= SNAP_THRESHOLD_DEG:
+                return infra_id_list[idx]
         
         infra_node_id = f"INFRA_{infra_node_counter}"
+        if infra_node_counter == len(infra_coords):
+            infra_coords = np.concatenate([infra_coords, np.empty_like(infra_coords)])
+        infra_coords[infra_node_counter] = coord
         infra_node_counter += 1
-        infra_nodes[coord] = infra_node_id
-        infra_coords_list.append(coord)
-        G.add_node(infra_node_id, node_type='infrastructure', lat=coord[1], lon=coord[0])
+        infra_id_list.append(infra_node_id)
+        if infra_node_counter - committed > max(committed, 64):
+            infra_tree = cKDTree(infra_coords[:infra_node_counter])
+            committed = infra_node_counter
+        infra_node_rows.append((infra_node_id, {'node_type': 'infrastructure', 'lat': coord[1], 'lon': coord[0]}))
         return infra_node_id
 
-    for idx, rail in gdf_railroads.iterrows():
-        if rail.geometry.geom_type != 'LineString':
+    # Endpoints of every LineString section, snapped to stations in one batched tree query
+    def column(name):
+        return gdf_railroads[name].tolist() if name in gdf_railroads.columns else [None] * len(gdf_railroads)
+
+    sections = []
+    for geom, line_name, operator in zip(gdf_railroads.geometry, column('N02_003'), column('N02_004')):
+        if geom.geom_type != 'LineString':
             continue
-        
-        coords = list(rail.geometry.coords)
-        start_coord = coords[0]
-        end_coord = coords[-1]
-        
-        def resolve_endpoint(coord):
-            if coord in coord_to_station:
-                return coord_to_station[coord]
-            dist, idx = station_tree.query(coord)
-            if spatial_snapping and dist <= SNAP_THRESHOLD_DEG:
-                return coord_to_station_list[idx]
-            return get_or_create_infra_node(coord)
-        
-        start_node = resolve_endpoint(start_coord)
-        end_node = resolve_endpoint(end_coord)
+        coords = geom.coords
+        sections.append((coords[0], coords[-1], line_name, operator))
+
+    endpoints = np.array([coord for start, end, _, _ in sections for coord in (start, end)], dtype=float).reshape(-1, 2)
+    station_dists, station_idxs = station_tree.query(endpoints, workers=-1)
+    station_snapped = (station_dists <= SNAP_THRESHOLD_DEG) & spatial_snapping
+
+    def resolve_endpoint(coord, k):
+        if coord in coord_to_station:
+            return coord_to_station[coord]
+        if station_snapped[k]:
+            return coord_to_station_list[station_idxs[k]]
+        return get_or_create_infra_node(coord)
+
+    # (u, v) -> edge attributes; a pair seen again in either direction extends the first entry
+    edges = {}
+    for i, (start_coord, end_coord, line_name, operator) in enumerate(sections):
+        start_node = resolve_endpoint(start_coord, 2 * i)
+        end_node = resolve_endpoint(end_coord, 2 * i + 1)
         
         if start_node == end_node:
             continue
         
-        line_name = rail.get('N02_003')
-        operator = rail.get('N02_004')
-        
-        if G.has_edge(start_node, end_node):
-            if line_name and line_name not in G[start_node][end_node]['lines']:
-                G[start_node][end_node]['lines'].append(line_name)
+        key = (end_node, start_node) if (end_node, start_node) in edges else (start_node, end_node)
+        attrs = edges.get(key)
+        if attrs is not None:
+            if line_name and line_name not in attrs['lines']:
+                attrs['lines'].append(line_name)
         else:
-            G.add_edge(start_node, end_node, lines=[line_name] if line_name else [], operator=operator)
+            edges[key] = {'lines': [line_name] if line_name else [], 'operator': operator}
+
+    G.add_nodes_from(infra_node_rows)
+    G.add_edges_from((u, v, attrs) for (u, v), attrs in edges.items())
             
     return G
 
@@ -252,8 +313,9 @@ def process_japan(base_dir="datasets/japan", output_dir="datasets/japan"):
     
     print(f"Exporting graph to {output_path}...")
     output_dir.mkdir(parents=True, exist_ok=True)
-    with open(output_path, 'wb') as f:
-        pickle.dump(G, f)
+    # Newest protocol (framed, compact opcodes) through a 1 MiB write buffer
+    with open(output_path, 'wb', buffering=1 << 20) as f:
+        pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
     print("Export successful.")
 
 
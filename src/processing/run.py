@@ -1,5 +1,5 @@
 import argparse
-import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from src.processing import process_switzerland, process_japan
 
 def main():
@@ -25,14 +25,10 @@ def main():
     # If running multiple tasks, use multiprocessing
     if len(tasks) > 1:
         print(f"Running {len(tasks)} pipelines in parallel...")
-        processes = []
-        for task in tasks:
-            p = multiprocessing.Process(target=task)
-            p.start()
-            processes.append(p)
-        
-        for p in processes:
-            p.join()
+        with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = [executor.submit(task) for task in tasks]
+            for future in futures:
+                future.result()
     else:
         # Run single task directly
         tasks[0]()
@@ -1,10 +1,14 @@
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import networkx as nx
 import pickle
 from pathlib import Path
+import shapely
 from shapely.geometry import Point, LineString
+from pyproj import Transformer
+from scipy.spatial import cKDTree
 
 def parse_geopos(value):
     if isinstance(value, str) and ',' in value:
@@ -29,16 +33,37 @@ def classify_station(abbreviation, station_abbreviation_set, fallback_rows=None)
             return True
     return False
 
-def flatten_lines(geom):
-    if geom is None or geom.is_empty:
-        return []
-    coords = []
-    if geom.geom_type == 'LineString':
-        coords.extend((pt[1], pt[0]) for pt in geom.coords)
-    elif geom.geom_type == 'MultiLineString':
-        for line in geom.geoms:
-            coords.extend((pt[1], pt[0]) for pt in line.coords)
-    return coords
+def column_values(df, column):
+    """Values of `column` as a list, or all None if the column is missing (like row.get)."""
+    if column in df.columns:
+        return df[column].tolist()
+    return [None] * len(df)
+
+
+EARTH_RADIUS_M = 6371008.8  # mean Earth radius
+
+def pairs_within(lats, lons, radius_m):
+    """
+    All index pairs (i < j) of points closer than radius_m along the great circle,
+    sorted, together with their distances in meters. Neighbours are found in C with a
+    KD-tree over unit-sphere XYZ, where a great-circle radius is a fixed chord length.
+    """
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    xyz = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    chord = 2 * np.sin(radius_m / (2 * EARTH_RADIUS_M))
+    pairs = cKDTree(xyz).query_pairs(chord, output_type='ndarray')
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    half_chords = np.linalg.norm(xyz[pairs[:, 0]] - xyz[pairs[:, 1]], axis=1) / 2
+    dists = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(half_chords, 1.0))
+    keep = dists < radius_m
+    return pairs[keep], dists[keep]
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters; arguments in degrees, scalars or arrays (broadcast)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
 
 
 def load_data(base_dir):
@@ -52,8 +77,9 @@ def load_data(base_dir):
     
     # Load Swisstopo data
     try:
-        net_segments = gpd.read_file(SWISSTOPO_GDB_PATH, layer='Netzsegment')
-        net_nodes = gpd.read_file(SWISSTOPO_GDB_PATH, layer='Netzknoten')
+        # pyogrio + Arrow reads each layer's columns in bulk instead of feature by feature
+        net_segments = gpd.read_file(SWISSTOPO_GDB_PATH, layer='Netzsegment', engine='pyogrio', use_arrow=True)
+        net_nodes = gpd.read_file(SWISSTOPO_GDB_PATH, layer='Netzknoten', engine='pyogrio', use_arrow=True)
     except Exception as e:
         print(f"Error loading GDB file: {e}")
         return None, None, None
@@ -79,66 +105,86 @@ def build_graph(net_nodes, net_segments, station_abbreviation_set):
     """Constructs the NetworkX graph from nodes and segments."""
     G = nx.Graph()
     
-    nodes_gdf = net_nodes.to_crs(4326)
-    segments_wgs84 = net_segments.to_crs(4326)
+    # Reproject raw coordinate arrays with one vectorized pyproj call each, not via GeoSeries.to_crs
+    def to_lat_lon(crs, x, y):
+        lon, lat = Transformer.from_crs(crs, 4326, always_xy=True).transform(x, y)
+        return np.asarray(lat), np.asarray(lon)
 
     # Process Nodes
-    for _, row in nodes_gdf.iterrows():
-        node_id = row['xtf_id']
-        abbr = row.get('Betriebspunkt_Abkuerzung')
-        label = abbr or row.get('Betriebspunkt_Name') or node_id
-        lat = row.geometry.y
-        lon = row.geometry.x
-        is_station = False
-        if isinstance(abbr, str) and abbr.strip():
-            is_station = abbr.strip().upper() in station_abbreviation_set
-        
-        node_attrs = {
-            'label': label,
-            'abbreviation': abbr,
-            'lat': lat,
-            'lon': lon,
-            'is_station': is_station,
-            'rows': [row.drop(labels='geometry').to_dict()],
-            'source': 'swisstopo',
-        }
-        G.add_node(node_id, **node_attrs)
+    # Pull the columns out once instead of materializing a Series per row
+    node_ids = net_nodes['xtf_id'].tolist()
+    abbrs = column_values(net_nodes, 'Betriebspunkt_Abkuerzung')
+    names = column_values(net_nodes, 'Betriebspunkt_Name')
+    lats, lons = to_lat_lon(net_nodes.crs, net_nodes.geometry.x.to_numpy(), net_nodes.geometry.y.to_numpy())
+    lats, lons = lats.tolist(), lons.tolist()
+    clean_abbrs = pd.Series(abbrs, dtype=object).str.strip()
+    is_station = (
+        (clean_abbrs.str.len() > 0) & clean_abbrs.str.upper().isin(station_abbreviation_set)
+    ).tolist()
+
+    G.add_nodes_from(
+        (
+            node_id,
+            {
+                'label': abbr or name or node_id,
+                'abbreviation': abbr,
+                'lat': lat,
+                'lon': lon,
+                'is_station': station,
+                'source': 'swisstopo',
+            },
+        )
+        for node_id, abbr, name, lat, lon, station
+        in zip(node_ids, abbrs, names, lats, lons, is_station)
+    )
     
     print(f"Nodes loaded: {G.number_of_nodes()}")
 
     # Process Edges
-    for _, row in segments_wgs84.iterrows():
-        u = row['rAnfangsknoten']
-        v = row['rEndknoten']
-        
+    # (lat, lon) vertices of every segment in one call, sliced into one list of tuples per segment
+    vertices, vertex_segment = shapely.get_coordinates(net_segments.geometry.to_numpy(), return_index=True)
+    vertex_tuples = list(map(tuple, np.column_stack(to_lat_lon(net_segments.crs, vertices[:, 0], vertices[:, 1])).tolist()))
+    bounds = np.searchsorted(vertex_segment, np.arange(len(net_segments) + 1)).tolist()
+    segment_coords = (vertex_tuples[start:end] for start, end in zip(bounds, bounds[1:]))
+    segment_columns = zip(
+        net_segments['rAnfangsknoten'].tolist(),
+        net_segments['rEndknoten'].tolist(),
+        net_segments['xtf_id'].tolist(),
+        column_values(net_segments, 'Name'),
+        column_values(net_segments, 'AnzahlStreckengleise'),
+        column_values(net_segments, 'Spurweite'),
+        column_values(net_segments, 'Elektrifizierung'),
+        segment_coords,
+    )
+    # (u, v) -> (line names, segments); a pair seen again in either direction extends the first entry
+    edges = {}
+    for u, v, segment_id, name, track_count, gauge, electrified, coords in segment_columns:
         if pd.isna(u) or pd.isna(v):
             continue
         if u not in G.nodes or v not in G.nodes:
             continue
             
-        lines = [row['Name']] if isinstance(row.get('Name'), str) else []
+        lines = [name] if isinstance(name, str) else []
         segment_meta = {
-            'segment_id': row['xtf_id'],
-            'line_name': row.get('Name'),
-            'track_count': row.get('AnzahlStreckengleise'),
-            'gauge': row.get('Spurweite'),
-            'electrified': row.get('Elektrifizierung'),
-            'coords_wgs84': flatten_lines(row.geometry),
+            'segment_id': segment_id,
+            'line_name': name,
+            'track_count': track_count,
+            'gauge': gauge,
+            'electrified': electrified,
+            'coords_wgs84': coords,
         }
         
-        if G.has_edge(u, v):
-            combined = set(G[u][v]['lines'])
-            combined.update(lines)
-            G[u][v]['lines'] = sorted(combined)
-            G[u][v]['segments'].append(segment_meta)
+        key = (v, u) if (v, u) in edges else (u, v)
+        if key in edges:
+            edges[key][0].update(lines)
+            edges[key][1].append(segment_meta)
         else:
-            G.add_edge(
-                u,
-                v,
-                lines=sorted(lines),
-                segments=[segment_meta],
-                source='swisstopo',
-            )
+            edges[key] = (set(lines), [segment_meta])
+
+    G.add_edges_from(
+        (u, v, {'lines': sorted(lines), 'segments': segments, 'source': 'swisstopo'})
+        for (u, v), (lines, segments) in edges.items()
+    )
             
     return G
 
@@ -162,8 +208,6 @@ def process_switzerland(base_dir="datasets/switzerland", output_dir="datasets/sw
 
     # 4. UNIFICATION (Merge + Link + Patch)
     # Copied from legacy process_graph.py to ensure continuity
-    from geopy.distance import geodesic
-
     MERGE_RADIUS = 150  # Collapse nodes closer than this
     LINK_RADIUS = 500   # Add edges between nodes closer than this
     
@@ -183,64 +227,52 @@ def process_switzerland(base_dir="datasets/switzerland", output_dir="datasets/sw
     # --- 4a. MERGE PASS ---
     print(f"Merging nodes < {MERGE_RADIUS}m...")
     node_coords = get_node_coords(G)
-    bucket_size = MERGE_RADIUS / 111000.0
-    grid = {}
-    for item in node_coords:
-        k = (int(item['lat']/bucket_size), int(item['lon']/bucket_size))
-        if k not in grid: grid[k] = []
-        grid[k].append(item)
+    node_ids = [item['id'] for item in node_coords]
+    pairs, _ = pairs_within(
+        [item['lat'] for item in node_coords], [item['lon'] for item in node_coords], MERGE_RADIUS
+    )
 
     merge_graph = nx.Graph()
     merge_graph.add_nodes_from(G.nodes())
-    
-    for item in node_coords:
-        base_lat = int(item['lat']/bucket_size)
-        base_lon = int(item['lon']/bucket_size)
-        for dlat in [-1,0,1]:
-            for dlon in [-1,0,1]:
-                cand_key = (base_lat+dlat, base_lon+dlon)
-                for cand in grid.get(cand_key, []):
-                    if item['id'] < cand['id']:
-                        dist = geodesic((item['lat'], item['lon']), (cand['lat'], cand['lon'])).meters
-                        if dist < MERGE_RADIUS:
-                            merge_graph.add_edge(item['id'], cand['id'])
+    merge_graph.add_edges_from((node_ids[i], node_ids[j]) for i, j in pairs.tolist())
     
     mapping = {}
     for comp in nx.connected_components(merge_graph):
         if len(comp) > 1:
-            rep = sorted(list(comp))[0]
+            rep = min(comp)
             for node in comp:
                 mapping[node] = rep
     
-    G = nx.relabel_nodes(G, mapping, copy=True)
-    G.remove_edges_from(nx.selfloop_edges(G))
+    # Relabel in place, moving only the non-representative nodes (in G order). Like a relabelled copy,
+    # each merged node keeps the attributes of the last node of its component in G order.
+    moves = {node: rep for node, rep in mapping.items() if node != rep}
+    if moves:
+        merged_attrs = {mapping[node]: dict(attrs) for node, attrs in G.nodes(data=True) if node in mapping}
+        nx.relabel_nodes(G, moves, copy=False)
+        for rep, attrs in merged_attrs.items():
+            G.nodes[rep].clear()
+            G.nodes[rep].update(attrs)
+    else:
+        print("No merges needed.")
+    # Raw segments can already start and end at the same node, so this covers every node, not only reps
+    G.remove_edges_from(list(nx.selfloop_edges(G)))
     print(f"Merge complete. Nodes: {len(G)}")
 
     # --- 4b. LINK PASS ---
     print(f"Linking nodes < {LINK_RADIUS}m...")
     node_coords = get_node_coords(G) # Refresh coords
     coord_map = {item['id']: (item['lat'], item['lon']) for item in node_coords}
-    bucket_size = LINK_RADIUS / 111000.0
-    grid = {}
-    for item in node_coords:
-        k = (int(item['lat']/bucket_size), int(item['lon']/bucket_size))
-        if k not in grid: grid[k] = []
-        grid[k].append(item)
+    node_ids = [item['id'] for item in node_coords]
+    pairs, dists = pairs_within(
+        [item['lat'] for item in node_coords], [item['lon'] for item in node_coords], LINK_RADIUS
+    )
     
     added_links = 0
-    for item in node_coords:
-        base_lat = int(item['lat']/bucket_size)
-        base_lon = int(item['lon']/bucket_size)
-        for dlat in [-1,0,1]:
-            for dlon in [-1,0,1]:
-                cand_key = (base_lat+dlat, base_lon+dlon)
-                for cand in grid.get(cand_key, []):
-                    if item['id'] < cand['id']:
-                        if not G.has_edge(item['id'], cand['id']):
-                            dist = geodesic((item['lat'], item['lon']), (cand['lat'], cand['lon'])).meters
-                            if dist < LINK_RADIUS:
-                                G.add_edge(item['id'], cand['id'], weight=dist, type='synthetic_link')
-                                added_links += 1
+    for (i, j), dist in zip(pairs.tolist(), dists.tolist()):
+        u, v = node_ids[i], node_ids[j]
+        if not G.has_edge(u, v):
+            G.add_edge(u, v, weight=dist, type='synthetic_link')
+            added_links += 1
     print(f"Added {added_links} global synthetic links.")
 
     # --- 4c. MANUAL PATCHES ---
@@ -256,7 +288,7 @@ def process_switzerland(base_dir="datasets/switzerland", output_dir="datasets/sw
     v = mapping.get(v, v)
     if G.has_node(u) and G.has_node(v) and u != v:
         if not G.has_edge(u, v):
-            dist = geodesic(coord_map[u], coord_map[v]).meters
+            dist = float(haversine_m(*coord_map[u], *coord_map[v]))
             G.add_edge(u, v, weight=dist, type='manual_patch')
             print(f"Fixed Buchs SG ({u}-{v})")
 
@@ -271,28 +303,32 @@ def process_switzerland(base_dir="datasets/switzerland", output_dir="datasets/sw
                 if 'monthey' in name and n != center:
                     targets.append(n)
             
-            for t in targets:
-                if t in coord_map:
-                    dist = geodesic(center_pos, coord_map[t]).meters
-                    if dist < 1500:
-                        G.add_edge(center, t, weight=dist, type='manual_patch')
-                        print(f"Linked Monthey node {t} to Center")
+            targets = [t for t in targets if t in coord_map]
+            target_dists = haversine_m(
+                *center_pos, [coord_map[t][0] for t in targets], [coord_map[t][1] for t in targets]
+            )
+            for t, dist in zip(targets, target_dists.tolist()):
+                if dist < 1500:
+                    G.add_edge(center, t, weight=dist, type='manual_patch')
+                    print(f"Linked Monthey node {t} to Center")
     except Exception as e:
         print(f"Warning: Monthey patch failed: {e}")
 
     # Patch C: Hofstetten / Oberglatt
     try:
-        near_nodes = []
-        for n, pos in coord_map.items():
-            if geodesic(pos, FIX_HOFSTETTEN_COORDS).meters < FIX_HOFSTETTEN_RADIUS:
-                near_nodes.append(n)
+        all_ids = list(coord_map)
+        all_lats = np.fromiter((pos[0] for pos in coord_map.values()), dtype=np.float64, count=len(coord_map))
+        all_lons = np.fromiter((pos[1] for pos in coord_map.values()), dtype=np.float64, count=len(coord_map))
+        ref_dists = haversine_m(all_lats, all_lons, *FIX_HOFSTETTEN_COORDS)
+        near = np.flatnonzero(ref_dists < FIX_HOFSTETTEN_RADIUS)
+        near = near[np.argsort(ref_dists[near], kind='stable')]
         
-        if len(near_nodes) > 1:
-            near_nodes.sort(key=lambda n: geodesic(coord_map[n], FIX_HOFSTETTEN_COORDS).meters)
-            hub = near_nodes[0]
-            for other in near_nodes[1:]:
-                 if not G.has_edge(hub, other):
-                    dist = geodesic(coord_map[hub], coord_map[other]).meters
+        if len(near) > 1:
+            hub = all_ids[near[0]]
+            hub_dists = haversine_m(all_lats[near[0]], all_lons[near[0]], all_lats[near[1:]], all_lons[near[1:]])
+            for k, dist in zip(near[1:].tolist(), hub_dists.tolist()):
+                other = all_ids[k]
+                if not G.has_edge(hub, other):
                     G.add_edge(hub, other, weight=dist, type='manual_manual')
                     print(f"Fixed Hofstetten/Oberglatt: Linked {other} to {hub}")
     except Exception as e:
@@ -307,8 +343,9 @@ def process_switzerland(base_dir="datasets/switzerland", output_dir="datasets/sw
     
     print(f"Exporting unified graph to {UNIFIED_OUTPUT_PATH}...")
     output_dir.mkdir(parents=True, exist_ok=True)
-    with open(UNIFIED_OUTPUT_PATH, 'wb') as f:
-        pickle.dump(G, f)
+    # Newest protocol (framed, compact opcodes) through a 1 MiB write buffer
+    with open(UNIFIED_OUTPUT_PATH, 'wb', buffering=1 << 20) as f:
+        pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
     print("Export successful.")
 
 
@@ -1,179 +1,465 @@
+import hashlib
+import weakref
+
 import folium
 import networkx as nx
-import math
 import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import numpy as np
+from branca.element import Figure, MacroElement
+from jinja2 import Template
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import connected_components
+
+# RGBA rows of the 20 tab20 colors; component i is drawn with _TAB20[i % 20]
+_TAB20 = plt.colormaps['tab20'](np.arange(20))
+
+# Rendered map HTML per graph for the cache_key argument: {G: {(builder args, cache_key): (fingerprint, html)}}.
+# Held outside G.graph so graphs stay picklable/exportable and copies do not share entries.
+_MAP_HTML_CACHE = weakref.WeakKeyDictionary()
+
+
+class _BatchDetails(MacroElement):
+    """
+    Styles, tooltips and popups of the features in its parent folium.GeoJson. Distinct style
+    dicts and tooltip texts are shipped once per layer; each feature carries a style_id and
+    tooltip_ids / popups lists with one entry (or null) per Leaflet layer it becomes: one per
+    point of a MultiPoint, a single one for a MultiLineString. One client-side pass after the
+    data is added resolves them.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var styles = {{ this.styles|tojson }};
+            var tooltips = {{ this.tooltips|tojson }};
+            {{ this._parent.get_name() }}.eachLayer(function(layer) {
+                var props = layer.feature.properties;
+                layer.setStyle(styles[props.style_id]);
+                (layer.getLayers ? layer.getLayers() : [layer]).forEach(function(part, i) {
+                    if (props.tooltip_ids && props.tooltip_ids[i] !== null) { part.bindTooltip('<div>' + tooltips[props.tooltip_ids[i]] + '</div>', {sticky: true}); }
+                    if (props.popups && props.popups[i] !== null) { part.bindPopup(props.popups[i], {maxWidth: 200}); }
+                });
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, styles, tooltips):
+        super().__init__()
+        self._name = 'BatchDetails'
+        self.styles = styles
+        self.tooltips = tooltips
+
+
+def _append_detail(properties, name, value, index):
+    """Sets entry index of the properties[name] list, created (null-padded) on the first non-None value."""
+    values = properties.get(name)
+    if value is not None and values is None:
+        values = properties[name] = [None] * index
+    if values is not None:
+        values.append(value)
+
+
+class _BatchLayer:
+    """
+    Collects many Leaflet vectors of one kind (polyline or circleMarker) for a parent layer and
+    adds them as a single folium.GeoJson FeatureCollection, so the map holds one element per
+    layer instead of one folium object per edge/node. Styles and tooltips are deduplicated into
+    shared tables (see _BatchDetails). Points sharing a style become one MultiPoint feature;
+    lines sharing a style and tooltip become one MultiLineString feature.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.features = []
+        self._groups = {}
+        self.styles = []
+        self._style_idx = {}
+        self.tooltips = []
+        self._tooltip_idx = {}
+
+    def add(self, coords, style, tooltip=None, popup=None):
+        key = tuple(sorted(style.items()))
+        if key not in self._style_idx:
+            self._style_idx[key] = len(self.styles)
+            self.styles.append(style)
+        style_id = self._style_idx[key]
+        tooltip_id = None
+        if tooltip is not None:
+            if tooltip not in self._tooltip_idx:
+                self._tooltip_idx[tooltip] = len(self.tooltips)
+                self.tooltips.append(tooltip)
+            tooltip_id = self._tooltip_idx[tooltip]
+
+        # coords are [lat, lon] (circleMarker) or a list of them (polyline); GeoJSON wants [lon, lat]
+        if self.kind == 'polyline':
+            part = [[lon, lat] for lat, lon in coords]
+            # A multi-polyline is a single Leaflet layer sharing one tooltip/popup
+            group_key = (style_id, tooltip_id) if popup is None else None
+        else:
+            part = [coords[1], coords[0]]
+            group_key = style_id
+
+        feature = self._groups.get(group_key) if group_key is not None else None
+        if feature is None:
+            geometry_type = 'MultiLineString' if self.kind == 'polyline' else 'MultiPoint'
+            feature = {'type': 'Feature', 'geometry': {'type': geometry_type, 'coordinates': []},
+                       'properties': {'style_id': style_id}}
+            self.features.append(feature)
+            if group_key is not None:
+                self._groups[group_key] = feature
+        parts = feature['geometry']['coordinates']
+        parts.append(part)
+        if self.kind == 'circleMarker' or len(parts) == 1:
+            index = len(parts) - 1 if self.kind == 'circleMarker' else 0
+            _append_detail(feature['properties'], 'tooltip_ids', tooltip_id, index)
+            _append_detail(feature['properties'], 'popups', popup, index)
+
+    def add_to(self, parent):
+        if not self.features:
+            return parent
+        layer = folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': self.features},
+            control=False,
+            marker=folium.CircleMarker() if self.kind == 'circleMarker' else None,
+        )
+        layer.add_child(_BatchDetails(self.styles, self.tooltips))
+        layer.add_to(parent)
+        return parent
+
+
+def _lines_tooltip(lines, cache):
+    """'Line: a, b' tooltip for an edge's lines, built once per distinct line set in cache."""
+    key = tuple(lines)
+    tooltip = cache.get(key)
+    if tooltip is None:
+        tooltip = cache[key] = 'Line: ' + ', '.join(key)
+    return tooltip
+
 
-def create_folium_map(G, title="Rail Network", color_by_component=False):
+def _nodes_to_arrays(G):
+    """
+    Node ids and coordinates as NumPy arrays, built in one pass over G.nodes(data=True).
+    Missing coordinates are NaN; valid_mask marks nodes whose lat and lon are both finite.
+    """
+    ids = np.empty(len(G), dtype=object)
+    coords = np.full((len(G), 2), np.nan)
+    for i, (node, data) in enumerate(G.nodes(data=True)):
+        ids[i] = node
+        lat, lon = data.get('lat'), data.get('lon')
+        if lat is not None and lon is not None:
+            coords[i] = lat, lon
+    lat, lon = coords[:, 0], coords[:, 1]
+    valid_mask = np.isfinite(lat) & np.isfinite(lon)
+    return ids, lat, lon, valid_mask
+
+
+def _node_labels(G):
+    """Display label of every node (label, else name, else the node id) as a str object array."""
+    return np.array([str(data.get('label', data.get('name', node))) for node, data in G.nodes(data=True)], dtype=object)
+
+
+def _graph_centroid(G):
+    """
+    Map center of G and its node arrays (see _nodes_to_arrays), as (center, arrays).
+    The center is the mean of the valid coordinates, leaving out (0, 0) placeholders, or None
+    when no node has one.
+    """
+    ids, lat, lon, valid_mask = _nodes_to_arrays(G)
+    center_mask = valid_mask & (lat != 0) & (lon != 0)
+    center = (lat[center_mask].mean(), lon[center_mask].mean()) if center_mask.any() else None
+    return center, (ids, lat, lon, valid_mask)
+
+
+def _adjacency(G):
+    """
+    CSR adjacency matrix of G in node order. Builders call this once and pass the matrix to
+    _components and _edge_arrays.
+    """
+    if not len(G):
+        return csr_array((0, 0), dtype=np.int8)
+    return nx.to_scipy_sparse_array(G, weight=None, format='csr')
+
+
+def _edge_arrays(adjacency):
+    """
+    Edge endpoints as node-index arrays (rows < cols, indices in G's node order), read from
+    the upper triangle of the CSR adjacency. Self-loops are left out.
+    """
+    rows = np.repeat(np.arange(adjacency.shape[0]), np.diff(adjacency.indptr))
+    cols = adjacency.indices
+    upper = rows < cols
+    return rows[upper], cols[upper]
+
+
+def _edge_coords(lat, lon, rows, cols):
+    """
+    [[lat, lon], [lat, lon]] segment per edge, gathered into one (E, 2, 2) array and converted
+    with a single tolist() instead of a nested list per edge in the drawing loop.
+    """
+    latlon = np.column_stack([lat, lon])
+    return latlon[np.column_stack([rows, cols])].tolist()
+
+
+def _components(adjacency, by_size=True):
+    """
+    Connected-component label of every node (in G's node order, from its CSR adjacency) and
+    the component sizes.
+    With by_size, labels are renumbered by descending size so 0 is the largest component; ties
+    keep first-appearance order, matching sorted(nx.connected_components(G), key=len, reverse=True).
+    Without it, the raw scipy labels are returned, for callers that only need sizes.argmax().
+    """
+    if adjacency.shape[0]:
+        _, labels = connected_components(adjacency, directed=False)
+    else:
+        labels = np.empty(0, dtype=np.int32)
+    sizes = np.bincount(labels)
+
+    if not by_size:
+        return labels, sizes
+    order = np.argsort(-sizes, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[labels], sizes[order]
+
+
+def _save_map(m, out_path):
+    """
+    Writes m to out_path in a single render and returns the path; returns m unchanged when
+    out_path is None. Display a saved map with IPython.display.IFrame(out_path).
+    """
+    if out_path is None:
+        return m
+    m.save(out_path)
+    return out_path
+
+
+class _RenderedMap(Figure):
+    """
+    Already-rendered map HTML returned by the builders when a cache_key is given. It displays
+    in notebooks like a folium.Map and save(path) writes the HTML unchanged.
+    """
+
+    def __init__(self, html):
+        super().__init__()
+        self.rendered_html = html
+
+    def render(self, **kwargs):
+        return self.rendered_html
+
+
+def _graph_fingerprint(G):
+    """Node count, edge count and a hash of the node coordinates: a cheap check against edited graphs."""
+    _, lat, lon, _ = _nodes_to_arrays(G)
+    coords_hash = hashlib.blake2b(np.column_stack([lat, lon]).tobytes(), digest_size=16).hexdigest()
+    return len(G), G.number_of_edges(), coords_hash
+
+
+def _cached_map(G, key):
+    """
+    Looks up a map of G stored under key in _MAP_HTML_CACHE. Returns (fingerprint, hit), where
+    hit is a _RenderedMap or None when nothing is stored or G's fingerprint changed since.
+    """
+    fingerprint = _graph_fingerprint(G)
+    entry = _MAP_HTML_CACHE.get(G, {}).get(key)
+    if entry is not None and entry[0] == fingerprint:
+        return fingerprint, _RenderedMap(entry[1])
+    return fingerprint, None
+
+
+def _cache_map(G, key, fingerprint, m):
+    """
+    Renders m once, stores the HTML for G under key and returns it as a _RenderedMap, so
+    displaying or saving the result does not render m (and its layer scripts) again.
+    """
+    html = m.get_root().render()
+    _MAP_HTML_CACHE.setdefault(G, {})[key] = (fingerprint, html)
+    return _RenderedMap(html)
+
+
+def create_folium_map(G, title="Rail Network", color_by_component=False, small_component_size=None, out_path=None, cache_key=None):
     """
     Creates an interactive Folium map for a NetworkX graph.
-    Nodes are colored by type (Station=Blue, Infra=Orange, Isolated=Red).
+    Without color_by_component this is create_robustness_style_map (Core=Blue, Isolated=Red).
     If color_by_component is True, nodes and edges are colored by their connected component.
+    Level of detail is opt-in: if small_component_size is also given, components with fewer
+    nodes (other than the largest) go to a 'Small Components' layer that is hidden by default.
+    Without it (the default) every component is drawn in the visible layers, so existing calls
+    get the full map.
+    If out_path is given, the map is saved there as HTML and the path is returned instead.
+    If cache_key is given (any hashable token), the map is rendered once and returned as HTML
+    (a _RenderedMap); later calls with the same graph, arguments and cache_key reuse that HTML.
+    Node/edge counts and node coordinates are checked on every call, but after other edits to G
+    (labels, names, rewired edges) the caller must pass a new cache_key.
     """
+    if G.number_of_nodes() == 0:
+        return _save_map(folium.Map(), out_path)
     if not color_by_component:
-        return create_robustness_style_map(G, title)
+        return create_robustness_style_map(G, title, out_path=out_path, cache_key=cache_key)
+    key = ('folium', small_component_size, cache_key)
+    if cache_key is not None:
+        fingerprint, cached = _cached_map(G, key)
+        if cached is not None:
+            return _save_map(cached, out_path)
 
     # Calculate center
-    lats = [d['lat'] for _, d in G.nodes(data=True) if d.get('lat')]
-    lons = [d['lon'] for _, d in G.nodes(data=True) if d.get('lon')]
-    if not lats:
-        return folium.Map()
-        
-    center_lat = sum(lats) / len(lats)
-    center_lon = sum(lons) / len(lons)
+    center, (ids, lat, lon, valid_mask) = _graph_centroid(G)
+    if center is None:
+        return _save_map(folium.Map(), out_path)
+    center_lat, center_lon = center
 
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=9, tiles='CartoDB Positron')
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=9, tiles='CartoDB Positron', prefer_canvas=True)
     
     # Feature Groups
     edges_fg = folium.FeatureGroup(name='Edges', show=True)
     stations_fg = folium.FeatureGroup(name='Stations', show=True)
     infra_fg = folium.FeatureGroup(name='Infrastructure', show=False)
+    small_fg = folium.FeatureGroup(name='Small Components', show=False)
+    edge_lines = {edges_fg: _BatchLayer('polyline'), small_fg: _BatchLayer('polyline')}
+    node_markers = {layer: _BatchLayer('circleMarker') for layer in (stations_fg, infra_fg, small_fg)}
     
     # Component Analysis
-    components = sorted(nx.connected_components(G), key=len, reverse=True)
-    largest_cc = components[0] if components else set()
-    node_to_comp_idx = {}
-    for idx, comp in enumerate(components):
-        for node in comp:
-            node_to_comp_idx[node] = idx
+    adjacency = _adjacency(G)
+    labels, sizes = _components(adjacency)
+    # Level of detail (opt-in): small components are kept out of the default view
+    is_small = [bool(small_component_size) and idx > 0 and size < small_component_size for idx, size in enumerate(sizes.tolist())]
             
     colors = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6', '#bcf60c', '#fabebe']
     
-    # 1. Edges
-    for u, v, data in G.edges(data=True):
-        u_data = G.nodes[u]
-        v_data = G.nodes[v]
+    # 1. Edges (both endpoints need valid coordinates)
+    rows, cols = _edge_arrays(adjacency)
+    keep = valid_mask[rows] & valid_mask[cols]
+    rows, cols = rows[keep], cols[keep]
+    segments = _edge_coords(lat, lon, rows, cols)
+    # Styled by the source node's component (both endpoints of an edge share it)
+    src_comp = labels[rows]
+    line_tooltips = {}
+    
+    for r, c, segment, comp_idx in zip(rows.tolist(), cols.tolist(), segments, src_comp.tolist()):
+        layer = small_fg if is_small[comp_idx] else edges_fg
+        edge_lines[layer].add(
+            segment,
+            {'color': colors[comp_idx % len(colors)], 'weight': 2, 'opacity': 0.8},
+            tooltip=_lines_tooltip(G.adj[ids[r]][ids[c]].get('lines', []), line_tooltips)
+        )
         
-        if 'lat' in u_data and 'lat' in v_data:
-            
-            if color_by_component:
-                comp_idx = node_to_comp_idx.get(u, 0) # Assuming edges connect same component
-                color = colors[comp_idx % len(colors)]
-                opacity = 0.8
-                weight = 2
-            else:
-                is_in_main_cc = u in largest_cc
-                color = '#1f77b4' if is_in_main_cc else '#ff0000' # Blue vs Red
-                opacity = 0.5 if is_in_main_cc else 0.8
-                weight = 1.5 if is_in_main_cc else 2.5
-                
-            folium.PolyLine(
-                [[u_data['lat'], u_data['lon']], [v_data['lat'], v_data['lon']]],
-                color=color, weight=weight, opacity=opacity,
-                tooltip=f"Line: {', '.join(data.get('lines', []))}"
-            ).add_to(edges_fg)
-            
     # 2. Nodes
-    largest_cc = components[0] if components else set()
-
-    for node, data in G.nodes(data=True):
-        if 'lat' not in data: continue
-        
-        node_type = data.get('node_type', 'station' if data.get('is_station', False) else 'infrastructure')
-        is_in_main_cc = node in largest_cc
-        comp_idx = node_to_comp_idx.get(node, 0)
-        
-        if color_by_component:
-            color = colors[comp_idx % len(colors)]
-            radius = 4
-            fill_opacity = 0.8
-            layer = stations_fg
-            tooltip_txt = f"{data.get('label', data.get('name', node))} (Comp {comp_idx+1})"
-        else:
-            if not is_in_main_cc:
-                # Disconnected components -> RED
-                color = '#ff0000' # Red
-                radius = 5
-                fill_opacity = 0.9
-                layer = stations_fg 
-                tooltip_txt = f"{data.get('label', data.get('name', node))} (Disconnected)"
-            elif node_type == 'station' or data.get('is_station'):
-                color = '#1f77b4' # Blue
-                radius = 4
-                fill_opacity = 0.7
-                layer = stations_fg
-                tooltip_txt = data.get('label', data.get('name', node))
-            else:
-                color = '#ff7f0e' # Orange
-                radius = 3
-                fill_opacity = 0.7
-                layer = infra_fg
-                tooltip_txt = f"{data.get('label', data.get('name', node))} (Infra)"
+    # Component of each node read straight from the label array (indices in G's node order)
+    label_arr = _node_labels(G)
+    placed = np.flatnonzero(valid_mask)
+    for node, label, comp_idx, point in zip(
+        ids[placed].tolist(), label_arr[placed].tolist(), labels[placed].tolist(), np.column_stack([lat[placed], lon[placed]]).tolist()
+    ):
+        color = colors[comp_idx % len(colors)]
+        layer = small_fg if is_small[comp_idx] else stations_fg
             
-        popup_html = f"<b>{data.get('label', data.get('name', node))}</b><br>ID: {node}<br>Component: {comp_idx+1}"
-        
-        folium.CircleMarker(
-            location=[data['lat'], data['lon']],
-            radius=radius, color=color, fill=True, fill_color=color, fill_opacity=fill_opacity,
-            popup=folium.Popup(popup_html, max_width=200),
-            tooltip=tooltip_txt
-        ).add_to(layer)
+        node_markers[layer].add(
+            point,
+            {'radius': 4, 'color': color, 'fill': True, 'fillColor': color, 'fillOpacity': 0.8},
+            tooltip=f"{label} (Comp {comp_idx+1})",
+            popup=''.join(('<b>', label, '</b><br>ID: ', str(node), '<br>Component: ', str(comp_idx + 1)))
+        )
 
+    for layer, lines in edge_lines.items():
+        lines.add_to(layer)
+    for layer, markers in node_markers.items():
+        markers.add_to(layer)
     edges_fg.add_to(m)
     stations_fg.add_to(m)
     infra_fg.add_to(m)
+    if any(is_small):
+        small_fg.add_to(m)
     folium.LayerControl().add_to(m)
     
-    return m
+    if cache_key is not None:
+        m = _cache_map(G, key, fingerprint, m)
+    return _save_map(m, out_path)
 
-def plot_connected_components(G, title="Connected Components"):
+def plot_connected_components(G, title="Connected Components", raster_threshold=100_000, raster_bins=1024):
     """
     Plots the graph with nodes colored by their connected component.
+    Above raster_threshold nodes the points are binned onto a raster_bins x raster_bins grid and
+    drawn with imshow (each pixel shows the largest component among its nodes), so drawing cost
+    depends on the grid size instead of the node count.
     """
-    components = sorted(nx.connected_components(G), key=len, reverse=True)
-    
     # Valid nodes with coords
-    valid_nodes = [n for n in G.nodes if 'lat' in G.nodes[n] and 'lon' in G.nodes[n]]
-    if not valid_nodes:
+    ids, lat, lon, valid_mask = _nodes_to_arrays(G)
+    if not valid_mask.any():
         return
         
-    # Map node -> component index
-    node_color_map = {}
-    for idx, comp in enumerate(components):
-        for node in comp:
-            node_color_map[node] = idx
+    # Component index of every node, 0 = largest
+    adjacency = _adjacency(G)
+    labels, sizes = _components(adjacency)
             
     # Prepare coords and colors
-    lons = [G.nodes[n]['lon'] for n in valid_nodes]
-    lats = [G.nodes[n]['lat'] for n in valid_nodes]
-    colors = [node_color_map[n] for n in valid_nodes]
+    lons = lon[valid_mask]
+    lats = lat[valid_mask]
+    colors = labels[valid_mask]
     
     # Plot
     fig, ax = plt.subplots(figsize=(12, 10))
-    cmap = cm.get_cmap('tab20')
-    scatter = ax.scatter(lons, lats, c=colors, cmap=cmap, s=10, alpha=0.8)
+    if len(colors) > raster_threshold:
+        x_edges = np.linspace(lons.min(), lons.max(), raster_bins + 1)
+        y_edges = np.linspace(lats.min(), lats.max(), raster_bins + 1)
+        x_bin = np.clip(np.searchsorted(x_edges, lons, side='right') - 1, 0, raster_bins - 1)
+        y_bin = np.clip(np.searchsorted(y_edges, lats, side='right') - 1, 0, raster_bins - 1)
+        empty = len(sizes)
+        grid = np.full((raster_bins, raster_bins), empty)
+        np.minimum.at(grid, (y_bin, x_bin), colors)
+        image = _TAB20[grid % len(_TAB20)]
+        image[grid == empty, 3] = 0 # Transparent where no node falls
+        ax.imshow(
+            image, origin='lower', extent=[x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]],
+            interpolation='nearest', aspect='auto', alpha=0.8
+        )
+    else:
+        ax.scatter(lons, lats, c=_TAB20[colors % len(_TAB20)], s=10, alpha=0.8)
     
     # Legend for top 5 components
     handles = []
-    for i in range(min(5, len(components))):
-        color = cmap(i / 20) if len(components) > 1 else cmap(0) # Logic simplification
-        handles.append(plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=cmap(i%20), label=f"Comp {i+1}: {len(components[i])} nodes"))
+    for i in range(min(5, len(sizes))):
+        handles.append(plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=_TAB20[i % len(_TAB20)], label=f"Comp {i+1}: {sizes[i]} nodes"))
     
-    if len(components) > 5:
-         handles.append(plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='gray', label=f"Other {len(components)-5} comps"))
+    if len(sizes) > 5:
+         handles.append(plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='gray', label=f"Other {len(sizes)-5} comps"))
 
     ax.legend(handles=handles)
-    ax.set_title(f"{title}\n({len(components)} components, Largest: {len(components[0])/len(G)*100:.1f}%)")
+    ax.set_title(f"{title}\n({len(sizes)} components, Largest: {sizes[0]/len(G)*100:.1f}%)")
     ax.axis('off')
     plt.show()
     plt.close()
 
-def create_component_map(G):
+def create_component_map(G, small_component_size=None, min_edge_component_size=None, out_path=None, cache_key=None):
     """
     Creates an interactive map where distinct connected components have different colors.
     Shows edges and nodes. Creates a separate layer for EVERY component.
+    Both level-of-detail options are opt-in; by default every node and edge is drawn.
+    With small_component_size, components of the shared "Small Multitudes" layer with fewer
+    nodes are drawn as one representative marker at their mean position, and edges only carry
+    a line tooltip in components of at least that many nodes.
+    With min_edge_component_size, edges are only drawn for components with at least that
+    many nodes. It defaults to None (draw every edge), not 5; pass e.g. 5 to skip the edges of
+    components whose lines add nothing at the default zoom.
+    If out_path is given, the map is saved there as HTML and the path is returned instead.
+    If cache_key is given (any hashable token), the map is rendered once and returned as HTML
+    (a _RenderedMap); later calls with the same graph, arguments and cache_key reuse that HTML.
+    Node/edge counts and node coordinates are checked on every call, but after other edits to G
+    (labels, names, rewired edges) the caller must pass a new cache_key.
     """
+    key = ('component', small_component_size, min_edge_component_size, cache_key)
+    if cache_key is not None:
+        fingerprint, cached = _cached_map(G, key)
+        if cached is not None:
+            return _save_map(cached, out_path)
+
     # Calculate center
-    lats = [d['lat'] for _, d in G.nodes(data=True) if d.get('lat')]
-    lons = [d['lon'] for _, d in G.nodes(data=True) if d.get('lon')]
-    if not lats: return folium.Map()
-    center_lat = sum(lats) / len(lats)
-    center_lon = sum(lons) / len(lons)
+    center, (ids, lat, lon, valid_mask) = _graph_centroid(G)
+    if center is None: return _save_map(folium.Map(), out_path)
+    center_lat, center_lon = center
 
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=9, tiles='CartoDB Positron')
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=9, tiles='CartoDB Positron', prefer_canvas=True)
     
-    components = sorted(nx.connected_components(G), key=len, reverse=True)
+    adjacency = _adjacency(G)
+    labels, sizes = _components(adjacency)
     colors = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6', '#bcf60c', '#fabebe'] # Distinct colors
     
     # Create layers
@@ -182,97 +468,124 @@ def create_component_map(G):
     layers = {}
     limit_individual_layers = 50
     
-    small_comps_layer = folium.FeatureGroup(name=f"Small Multitudes ({max(0, len(components)-limit_individual_layers)} comps)", show=True)
+    small_comps_layer = folium.FeatureGroup(name=f"Small Multitudes ({max(0, len(sizes)-limit_individual_layers)} comps)", show=True)
+    # One polyline batch and one marker batch per layer; edges are added first so they draw below nodes
+    edge_lines = {}
+    node_markers = {}
     
-    for idx, comp in enumerate(components):
+    for idx, size in enumerate(sizes.tolist()):
         if idx < limit_individual_layers:
-            layer_name = f"Component {idx+1} ({len(comp)} nodes)"
+            layer_name = f"Component {idx+1} ({size} nodes)"
             # Show ALL layers by default as requested
             show_layer = True 
             layers[idx] = folium.FeatureGroup(name=layer_name, show=show_layer)
         else:
             # Map index to the shared layer
             layers[idx] = small_comps_layer
+        if layers[idx] not in edge_lines:
+            edge_lines[layers[idx]] = _BatchLayer('polyline')
+            node_markers[layers[idx]] = _BatchLayer('circleMarker')
+    # Level of detail: components summarized by a single marker
+    summarized = [bool(small_component_size) and idx >= limit_individual_layers and size < small_component_size
+                  for idx, size in enumerate(sizes.tolist())]
             
-    node_to_comp_idx = {}
-    for idx, comp in enumerate(components):
-        for node in comp:
-            node_to_comp_idx[node] = idx
-            
-    # Draw Edges first
-    for u, v, data in G.edges(data=True):
-        u_data = G.nodes[u]
-        v_data = G.nodes[v]
-        if 'lat' in u_data and 'lat' in v_data:
-            # Check for NaN
-            if math.isnan(u_data['lat']) or math.isnan(u_data['lon']) or math.isnan(v_data['lat']) or math.isnan(v_data['lon']):
-                continue
-                
-            comp_idx = node_to_comp_idx.get(u, 0)
-            color = colors[comp_idx % len(colors)]
-            target_layer = layers.get(comp_idx)
+    # Group node indices by component with one sort: component k is order[bounds[k]:bounds[k+1]]
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(len(sizes) + 1))
             
-            if target_layer:
-                folium.PolyLine(
-                    [[u_data['lat'], u_data['lon']], [v_data['lat'], v_data['lon']]],
-                    color=color, weight=2, opacity=0.7,
-                    tooltip=f"Line: {', '.join(data.get('lines', []))}"
-                ).add_to(target_layer)
+    # Draw Edges first (both endpoints need valid coordinates; summarized and, if requested, tiny components draw none)
+    rows, cols = _edge_arrays(adjacency)
+    edge_comp = labels[rows]
+    keep = (valid_mask[rows] & valid_mask[cols] & ~np.asarray(summarized, dtype=bool)[edge_comp]
+            & (sizes[edge_comp] >= (min_edge_component_size or 0)))
+    # Edges in the catch-all layer or in small components carry no tooltip
+    with_tooltip = (np.arange(len(sizes)) < limit_individual_layers) & (sizes >= (small_component_size or 0))
+    rows, cols, edge_comp = rows[keep], cols[keep], edge_comp[keep]
+    segments = _edge_coords(lat, lon, rows, cols)
+    line_tooltips = {}
+    for r, c, segment, comp_idx in zip(rows.tolist(), cols.tolist(), segments, edge_comp.tolist()):
+        edge_lines[layers[comp_idx]].add(
+            segment,
+            {'color': colors[comp_idx % len(colors)], 'weight': 2, 'opacity': 0.7},
+            tooltip=_lines_tooltip(G.adj[ids[r]][ids[c]].get('lines', []), line_tooltips) if with_tooltip[comp_idx] else None
+        )
 
-    # Draw Nodes
-    for idx, comp in enumerate(components):
+    # Draw Nodes (NaN / missing coordinates excluded via valid_mask)
+    for idx in range(len(sizes)):
         color = colors[idx % len(colors)]
         target_layer = layers.get(idx)
+        members = order[bounds[idx]:bounds[idx + 1]]
         
-        if target_layer:
-            for node in comp:
-                data = G.nodes[node]
-                if 'lat' not in data: continue
-                # Check for NaN
-                if math.isnan(data['lat']) or math.isnan(data['lon']):
-                    continue
-                
-                folium.CircleMarker(
-                    location=[data['lat'], data['lon']],
-                    radius=4, color=color, fill=True, fill_color=color, fill_opacity=0.8,
-                    popup=f"Comp {idx+1}: {node}",
-                    tooltip=f"Comp {idx+1}"
-                ).add_to(target_layer)
+        if target_layer and summarized[idx]:
+            placed = members[valid_mask[members]]
+            if len(placed):
+                node_markers[target_layer].add(
+                    [float(lat[placed].mean()), float(lon[placed].mean())],
+                    {'radius': 4, 'color': color, 'fill': True, 'fillColor': color, 'fillOpacity': 0.8},
+                    tooltip=f"Comp {idx+1} ({len(members)} nodes)",
+                    popup=f"Comp {idx+1}: {', '.join(map(str, ids[members].tolist()))}"
+                )
+        elif target_layer:
+            placed = members[valid_mask[members]]
+            for node, point in zip(ids[placed].tolist(), np.column_stack([lat[placed], lon[placed]]).tolist()):
+                node_markers[target_layer].add(
+                    point,
+                    {'radius': 4, 'color': color, 'fill': True, 'fillColor': color, 'fillOpacity': 0.8},
+                    tooltip=f"Comp {idx+1}",
+                    popup=f"Comp {idx+1}: {node}"
+                )
+
+    for layer in edge_lines:
+        edge_lines[layer].add_to(layer)
+        node_markers[layer].add_to(layer)
             
     # Add individual layers sorted
     for idx in sorted([k for k in layers.keys() if isinstance(k, int) and k < limit_individual_layers]):
         layers[idx].add_to(m)
     
     # Add the catch-all layer if used
-    if len(components) > limit_individual_layers:
+    if len(sizes) > limit_individual_layers:
         small_comps_layer.add_to(m)
         
     folium.LayerControl().add_to(m)
-    return m
+    if cache_key is not None:
+        m = _cache_map(G, key, fingerprint, m)
+    return _save_map(m, out_path)
 
-def create_robustness_style_map(G, title="Rail Network (Core vs Isolated)"):
+def create_robustness_style_map(G, title="Rail Network (Core vs Isolated)", out_path=None, cache_key=None):
     """
     Creates a Folium map matching the 'Robustness' visualization style.
     - Main Connected Component (Core): BLUE
     - Isolated Components: RED
     Matches style parameters from src.analysis.visualizer.NetworkVisualizer.
+    If out_path is given, the map is saved there as HTML and the path is returned instead.
+    If cache_key is given (any hashable token), the map is rendered once and returned as HTML
+    (a _RenderedMap); later calls with the same graph, arguments and cache_key reuse that HTML.
+    Node/edge counts and node coordinates are checked on every call, but after other edits to G
+    (labels, names, rewired edges) the caller must pass a new cache_key.
     """
+    key = ('robustness', cache_key)
+    if cache_key is not None:
+        fingerprint, cached = _cached_map(G, key)
+        if cached is not None:
+            return _save_map(cached, out_path)
+
     # 1. Calculate Center
-    lats = [d['lat'] for _, d in G.nodes(data=True) if d.get('lat')]
-    lons = [d['lon'] for _, d in G.nodes(data=True) if d.get('lon')]
-    if not lats: return folium.Map()
-    center_lat = sum(lats) / len(lats)
-    center_lon = sum(lons) / len(lons)
+    center, (ids, lat, lon, valid_mask) = _graph_centroid(G)
+    if center is None: return _save_map(folium.Map(), out_path)
+    center_lat, center_lon = center
 
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=8, tiles='CartoDB Positron')
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=8, tiles='CartoDB Positron', prefer_canvas=True)
     
     # 2. Identify Core (Largest Connected Component)
-    components = list(nx.connected_components(G))
-    if not components:
-        return m
+    # Only the largest component matters here, so skip ordering the rest
+    adjacency = _adjacency(G)
+    labels, sizes = _components(adjacency, by_size=False)
+    if not len(sizes):
+        return _save_map(m, out_path)
         
-    largest_cc = max(components, key=len)
-    lcc_set = set(largest_cc)
+    # Core membership as a boolean mask in G's node order
+    in_lcc = labels == sizes.argmax()
     
     # 3. Create Feature Groups for Layer Control
     # Using FeatureGroups allows toggling 'Core' vs 'Isolated'
@@ -280,58 +593,68 @@ def create_robustness_style_map(G, title="Rail Network (Core vs Isolated)"):
     fg_edges_iso = folium.FeatureGroup(name='Edges (Isolated)', show=True)
     fg_nodes_core = folium.FeatureGroup(name='Nodes (Core)', show=True)
     fg_nodes_iso = folium.FeatureGroup(name='Nodes (Isolated)', show=True)
+    batches = {
+        fg_edges_core: _BatchLayer('polyline'),
+        fg_edges_iso: _BatchLayer('polyline'),
+        fg_nodes_core: _BatchLayer('circleMarker'),
+        fg_nodes_iso: _BatchLayer('circleMarker'),
+    }
 
     # Styles from NetworkVisualizer (approximated for Folium)
     # style_core = {'color': 'blue', 'weight': 1, 'opacity': 0.6}
     # style_iso = {'color': 'red', 'weight': 1, 'opacity': 0.6}
     
-    # 4. Plot Edges
-    for u, v, data in G.edges(data=True):
-        u_data = G.nodes[u]
-        v_data = G.nodes[v]
+    # 4. Plot Edges (both endpoints need valid coordinates)
+    rows, cols = _edge_arrays(adjacency)
+    keep = valid_mask[rows] & valid_mask[cols]
+    rows, cols = rows[keep], cols[keep]
+    # If BOTH nodes are in LCC, it's a Core edge
+    is_core_edge = in_lcc[rows] & in_lcc[cols]
+    segments = _edge_coords(lat, lon, rows, cols)
+    line_tooltips = {}
+    for r, c, segment, is_core in zip(rows.tolist(), cols.tolist(), segments, is_core_edge.tolist()):
+        color = 'blue' if is_core else 'red'
+        target_fg = fg_edges_core if is_core else fg_edges_iso
         
-        if 'lat' in u_data and 'lat' in v_data:
-            # If BOTH nodes are in LCC, it's a Core edge
-            is_core = (u in lcc_set) and (v in lcc_set)
-            
-            color = 'blue' if is_core else 'red'
-            target_fg = fg_edges_core if is_core else fg_edges_iso
-            
-            # Note: robustness viz uses weight=1, opacity=0.6
-            folium.PolyLine(
-                [[u_data['lat'], u_data['lon']], [v_data['lat'], v_data['lon']]],
-                color=color, weight=1.5, opacity=0.6,
-                tooltip=f"Line: {', '.join(data.get('lines', []))}"
-            ).add_to(target_fg)
+        # Note: robustness viz uses weight=1, opacity=0.6
+        batches[target_fg].add(
+            segment,
+            {'color': color, 'weight': 1.5, 'opacity': 0.6},
+            tooltip=_lines_tooltip(G.adj[ids[r]][ids[c]].get('lines', []), line_tooltips)
+        )
 
     # 5. Plot Nodes
     # style_node_core = {'radius': 3, 'color': 'blue', 'fillColor': 'blue', 'fillOpacity': 0.8}
-    for node, data in G.nodes(data=True):
-        if 'lat' not in data: continue
+    label_arr = _node_labels(G)
+    for (node, data), valid, label, is_core in zip(G.nodes(data=True), valid_mask, label_arr, in_lcc.tolist()):
+        if not valid: continue
         
-        is_core = node in lcc_set
         color = 'blue' if is_core else 'red'
         target_fg = fg_nodes_core if is_core else fg_nodes_iso
         
-        popup_html = f"<b>{data.get('label', data.get('name', node))}</b><br>ID: {node}<br>{'Core' if is_core else 'Isolated'}"
-        
-        folium.CircleMarker(
-            location=[data['lat'], data['lon']],
-            radius=6, # Larger size
-            color=color, weight=1, # Match stroke to fill for 'chunkier' look
-            fill=True, fill_color=color, fill_opacity=0.8,
-            popup=folium.Popup(popup_html, max_width=200),
-            tooltip=data.get('label', str(node))
-        ).add_to(target_fg)
+        batches[target_fg].add(
+            [data['lat'], data['lon']],
+            {
+                'radius': 6, # Larger size
+                'color': color, 'weight': 1, # Match stroke to fill for 'chunkier' look
+                'fill': True, 'fillColor': color, 'fillOpacity': 0.8,
+            },
+            tooltip=str(data.get('label', str(node))),
+            popup=''.join(('<b>', label, '</b><br>ID: ', str(node), '<br>', 'Core' if is_core else 'Isolated'))
+        )
 
     # Add Layers
+    for fg, batch in batches.items():
+        batch.add_to(fg)
     fg_edges_core.add_to(m)
     fg_edges_iso.add_to(m)
     fg_nodes_core.add_to(m)
     fg_nodes_iso.add_to(m)
     
     folium.LayerControl().add_to(m)
-    return m
+    if cache_key is not None:
+        m = _cache_map(G, key, fingerprint, m)
+    return _save_map(m, out_path)
 
 def plot_static_map(G, title="Static Network Map", node_color='#1f77b4', edge_color='#6c757d'):
     """